@@ -0,0 +1,193 @@
+'''
+Benchmarks for the signal -> strategy -> backtest pipeline.
+
+Records wall time, peak traced memory and throughput (bars/s) per stage and data size, saves them as JSON, and flags
+stages that got slower than a baseline JSON from an earlier commit:
+
+    python benchmarks.py --sizes small medium --output bench_new.json --baseline bench_old.json --threshold 0.2
+
+Reference (pure pandas loop) stages are capped at max_rows bars and skipped for larger sizes. The pair screening
+stages run on a coin panel of at most PANEL_MAX_ROWS rows, built only when one of them runs.
+'''
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from helpers import crossing_stats, ssd_distance, ssd_distance_matrix, zero_crossings, zero_crossings_adaptive, \
+    zero_crossings_percentile, zero_crossings_with_buffer
+from portfolio_manager.constants import BINANCE_SPOT_FEE, HOURLY_INTEREST_RATE_BY_COIN
+from portfolio_manager.portfolio_manager import PortfolioManager
+from pricing_signals import PricingSignal, generate_pricing_signal_test_data
+from trading_strategy import BollingerBandTradeStrategy, generate_synthetic_zscore
+
+#name -> (n_bars, n_coins); n_coins is the width of the screening panel
+SIZES = {
+    'small': (10_000, 10),
+    'medium': (100_000, 50),
+    'large': (1_000_000, 200),
+    'xlarge': (10_000_000, 500),
+}
+HEDGE_LOOKBACK = 100
+SPREAD_LOOKBACK = 50
+ENTRY_THRESHOLD = 2.0
+EXIT_THRESHOLD = 0.5
+#Rows of the screening panel, whatever the bar count: a 10M x 500 float64 panel alone would be 40GB
+PANEL_MAX_ROWS = 100_000
+PANEL_STAGES = ('ssd_distance', 'ssd_distance_matrix')
+
+def make_data(n_bars: int, seed: int = 42) -> Dict:
+    '''Synthetic inputs of every stage, scaled up from the test data generators'''
+    signal_data = generate_pricing_signal_test_data(n_periods = n_bars, freq = '10s', regime_betas = [1.5, 0.8, 2.0, 1.2], seed = seed)
+    x, y = signal_data['x'], signal_data['y']
+    z_score = generate_synthetic_zscore(n_periods = n_bars, seed = seed)
+    z_score.index = x.index
+    beta = pd.Series(1.0, index = x.index)
+
+    #Backtest inputs: the strategy's positions on the (y, x) pair, quoted with a fixed spread around positive prices
+    coins = ['Y-USDT', 'X-USDT']
+    mid = pd.concat([y, x], axis = 1, keys = coins)
+    mid = mid - min(mid.min().min(), 0) + 1
+    quotes_df = pd.concat({coin: pd.DataFrame({'bid': mid[coin] * 0.9995, 'ask': mid[coin] * 1.0005}) for coin in coins}, axis = 1)
+    strategy = BollingerBandTradeStrategy(entry_threshold = ENTRY_THRESHOLD, exit_threshold = EXIT_THRESHOLD)
+    close_position_df = strategy.get_positions_fast(z_score, beta)
+    close_position_df.columns = coins
+
+    return {
+        'x': x, 'y': y, 'z_score': z_score, 'beta': beta, 'spread': y - x,
+        'quotes_df': quotes_df, 'close_position_df': close_position_df,
+    }
+
+def make_panel(n_rows: int, n_coins: int, seed: int = 42) -> pd.DataFrame:
+    '''Panel of n_coins positive random walks for the pair screening stages'''
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        np.exp(np.cumsum(rng.normal(0, 1e-3, (n_rows, n_coins)), axis = 0)) * 100,
+        index = pd.date_range('2024-01-01', periods = n_rows, freq = '10s'), columns = [f'COIN{i}-USDT' for i in range(n_coins)]
+    )
+
+def _portfolio_manager() -> PortfolioManager:
+    return PortfolioManager(trading_periods_per_year = 365 * 24 * 360, idealised = True,
+                            transaction_cost = BINANCE_SPOT_FEE, hourly_interest_rate_by_coin = HOURLY_INTEREST_RATE_BY_COIN)
+
+def _zero_crossings_all(spread: pd.Series):
+    for func in (zero_crossings, zero_crossings_with_buffer, zero_crossings_percentile, zero_crossings_adaptive):
+        func(spread)
+
+#name -> (data -> zero argument callable, max_rows or None)
+STAGES: Dict[str, tuple] = {
+    'pricing_signal': (lambda d: lambda: PricingSignal(HEDGE_LOOKBACK, SPREAD_LOOKBACK)._generate(d['x'], d['y']), None),
+    'pricing_signal_streaming': (lambda d: lambda: PricingSignal(HEDGE_LOOKBACK, SPREAD_LOOKBACK, backend = 'streaming')._generate(d['x'], d['y']), None),
+    'strategy': (lambda d: lambda: BollingerBandTradeStrategy(ENTRY_THRESHOLD, EXIT_THRESHOLD).get_positions(d['z_score'], d['beta']), 10_000),
+    'strategy_fast': (lambda d: lambda: BollingerBandTradeStrategy(ENTRY_THRESHOLD, EXIT_THRESHOLD).get_positions_fast(d['z_score'], d['beta']), None),
+    'backtest': (lambda d: lambda: _portfolio_manager().backtest(d['close_position_df'], d['quotes_df']), 10_000),
+    'backtest_vectorised': (lambda d: lambda: _portfolio_manager().backtest_vectorised(d['close_position_df'], d['quotes_df']), None),
+    'ssd_distance': (lambda d: lambda: ssd_distance(d['prices_df']), 100_000),
+    'ssd_distance_matrix': (lambda d: lambda: ssd_distance_matrix(d['prices_df']), None),
+    'zero_crossings': (lambda d: lambda: _zero_crossings_all(d['spread']), 1_000_000),
+    'crossing_stats': (lambda d: lambda: crossing_stats(d['spread'], modes = ('mean', 'std_buffer', 'percentile', 'rolling_vol')), None),
+}
+
+def measure(func: Callable, n_bars: int, repeats: int = 3) -> Dict:
+    '''Best wall time of repeats runs, then one traced run for peak memory (tracing slows the run, so it is not timed)'''
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = min(seconds)
+    return {
+        'seconds': best,
+        'seconds_all': seconds,
+        'peak_mb': peak / 1024**2,
+        'bars_per_second': n_bars / best if best > 0 else np.inf,
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes: List[str] = ('small',), stages: List[str] = None, repeats: int = 3) -> Dict:
+    '''Benchmark every stage at every size, returns {'meta': ..., 'results': [one record per (stage, size)]}'''
+    stages = stages or list(STAGES)
+    results = []
+    for size in sizes:
+        n_bars, n_coins = SIZES[size]
+        data = make_data(n_bars)
+        for stage in stages:
+            make_func, max_rows = STAGES[stage]
+            n_rows = min(n_bars, PANEL_MAX_ROWS) if stage in PANEL_STAGES else n_bars
+            record = {'stage': stage, 'size': size, 'n_bars': n_bars, 'n_rows': n_rows, 'n_coins': n_coins}
+            if max_rows is not None and n_bars > max_rows:
+                results.append({**record, 'skipped': f'n_bars > {max_rows}'})
+                continue
+            if stage in PANEL_STAGES and 'prices_df' not in data:
+                data['prices_df'] = make_panel(n_rows, n_coins)
+            func = make_func(data)
+            #Warm up: numba compilation, imports and caches are not part of the measurement
+            func()
+            results.append({**record, **measure(func, n_rows, repeats = repeats)})
+            print(f"{stage:>26} {size:>7}: {results[-1]['seconds']:.4f}s  {results[-1]['peak_mb']:.1f}MB  {results[-1]['bars_per_second']:,.0f} bars/s")
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': pd.Timestamp.now(tz = 'UTC').isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'repeats': repeats,
+        },
+        'results': results,
+    }
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.2) -> pd.DataFrame:
+    '''Stages measured in both runs, with slowdown = seconds / baseline seconds - 1, flagged when above threshold'''
+    def to_frame(run):
+        df = pd.DataFrame([r for r in run['results'] if 'seconds' in r])
+        return df.set_index(['stage', 'size'])[['seconds', 'peak_mb']] if len(df) else pd.DataFrame(columns = ['seconds', 'peak_mb'])
+    comparison_df = to_frame(results).join(to_frame(baseline), rsuffix = '_baseline', how = 'inner')
+    comparison_df['slowdown'] = comparison_df['seconds'] / comparison_df['seconds_baseline'] - 1
+    comparison_df['flagged'] = comparison_df['slowdown'] > threshold
+    return comparison_df
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description = 'Benchmark the signal -> strategy -> backtest pipeline')
+    parser.add_argument('--sizes', nargs = '+', default = ['small'], choices = list(SIZES))
+    parser.add_argument('--stages', nargs = '+', default = None, choices = list(STAGES))
+    parser.add_argument('--repeats', type = int, default = 3)
+    parser.add_argument('--output', default = 'bench.json', help = 'where to write the results JSON')
+    parser.add_argument('--baseline', default = None, help = 'results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type = float, default = 0.2, help = 'flag stages slower than baseline by more than this fraction')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.stages, repeats = args.repeats)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent = 2)
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    comparison_df = compare(results, baseline, threshold = args.threshold)
+    print(comparison_df.to_string())
+    flagged = comparison_df[comparison_df['flagged']]
+    if len(flagged):
+        print(f'Slower than baseline by more than {args.threshold:.0%}: ' + ', '.join(f'{stage} ({size})' for stage, size in flagged.index))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
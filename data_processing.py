@@ -1,4 +1,6 @@
 from typing import Literal
+import numpy as np
+import pandas as pd
 def summary_streaks_seconds(series, seconds_per_row = 10, stat: Literal['longest_location', 'describe'] = 'describe'):
     # Create groups of consecutive NaNs
     isnan = series.isna()
@@ -14,4 +16,59 @@ def summary_streaks_seconds(series, seconds_per_row = 10, stat: Literal['longest
         longest_streak_id = streak_counts.idxmax()
         # Find where this streak starts (first occurrence of this streak_id)
         longest_streak_indices = streak_groups[streak_groups == longest_streak_id].index
-        return longest_streak_indices[0], longest_streak_indices[-1]
\ No newline at end of file
+        return longest_streak_indices[0], longest_streak_indices[-1]
+
+GAP_COLUMNS = ['column', 'start', 'end', 'n_rows', 'seconds']
+REPAIR_METHODS = ['ffill', 'drop', 'mask']
+
+def _nan_runs(isnan: np.ndarray): 
+    '''Run-length encoding of the NaN mask (n_rows, n_columns): column, first row and length of every NaN run, ordered by column then row'''
+    padded = np.zeros((isnan.shape[0] + 2, isnan.shape[1]), dtype = np.int8)
+    padded[1:-1] = isnan
+    #+1 where a run starts, -1 one past where it ends 
+    edges = np.diff(padded, axis = 0).T
+    columns, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return columns, starts, stops - starts
+
+def find_gaps(df: pd.DataFrame, seconds_per_row = 10) -> pd.DataFrame: 
+    '''
+    All NaN streaks of every column of a panel in one pass (summary_streaks_seconds for every column at once). 
+    Returns: 
+        DataFrame with one row per gap: column label, start and end timestamp (first/last NaN row), n_rows, seconds 
+    '''
+    columns, starts, lengths = _nan_runs(df.isna().to_numpy())
+    return pd.DataFrame({
+        'column': df.columns[columns], 
+        'start': df.index[starts], 
+        'end': df.index[starts + lengths - 1], 
+        'n_rows': lengths, 
+        'seconds': lengths * seconds_per_row, 
+    }, columns = GAP_COLUMNS)
+
+def repair_gaps(df: pd.DataFrame, method: Literal['ffill', 'drop', 'mask'] = 'ffill', limit: int = None) -> pd.DataFrame: 
+    '''
+    Repair a price panel before backtesting. Gaps of at most limit rows (all gaps if None) are forward filled in place, 
+    column by column, without copying the panel. Then, for longer gaps: 
+        'ffill': leave them as NaN 
+        'drop': drop every row where any column is still NaN (returns a new frame) 
+        'mask': set whole rows to NaN where any column is still NaN, so no row mixes stale and fresh prices 
+    A gap at the very start of a column has nothing to fill from and is left as NaN. 
+    '''
+    if method not in REPAIR_METHODS: 
+        raise ValueError(f'method must be one of {REPAIR_METHODS}, got {method}')
+    isnan = df.isna().to_numpy()
+    columns, starts, lengths = _nan_runs(isnan)
+    fill = (starts > 0) if limit is None else (starts > 0) & (lengths <= limit)
+    for j in np.unique(columns[fill]): 
+        gaps = fill & (columns == j)
+        rows = np.concatenate([np.arange(start, start + length) for start, length in zip(starts[gaps], lengths[gaps])])
+        df.iloc[rows, j] = np.repeat(df.iloc[starts[gaps] - 1, j].to_numpy(), lengths[gaps])
+        isnan[rows, j] = False
+
+    still_missing = isnan.any(axis = 1)
+    if method == 'drop': 
+        return df[~still_missing]
+    if method == 'mask' and still_missing.any(): 
+        df.iloc[np.flatnonzero(still_missing)] = np.nan
+    return df
@@ -0,0 +1,146 @@
+import os
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from shared_arrays import SharedArrays, attach_shared_arrays
+from pricing_signals import PricingSignal
+from trading_strategy import BollingerBandTradeStrategy
+from portfolio_manager.constants import PRECISION_DTYPES
+from portfolio_manager.portfolio_manager import PortfolioManager
+
+METRIC_COLUMNS = ['sharpe', 'absolute_sharpe', 'absolute_sortino']
+
+#Per-process state, set once by _init_worker
+_WORKER = {}
+
+def _init_worker(specs, meta):
+    arrays, handles = attach_shared_arrays(specs)
+    index = pd.DatetimeIndex(arrays['index'].view(meta['index_dtype']))
+    if meta['tz'] is not None:
+        index = index.tz_localize('UTC').tz_convert(meta['tz'])
+    _WORKER.update(arrays = arrays, handles = handles, meta = meta, index = index)
+
+def backtest_thresholds(index: pd.DatetimeIndex, coins: List[str], z_score: pd.Series, beta: pd.Series, thresholds: List[Tuple[float, float]], 
+                        bid: np.ndarray, ask: np.ndarray, portfolio_kwargs: Dict, instant_execution: bool = False, 
+                        keep_summaries: bool = False) -> List[Dict]: 
+    '''Positions for every (entry, exit) threshold pair from one z_score in a single kernel call, then backtest_arrays for each'''
+    positions = BollingerBandTradeStrategy.get_positions_batch(z_score = z_score, beta = beta, thresholds = thresholds,
+                                                               precision = portfolio_kwargs.get('precision', 'float64'))
+    #(n_periods, n_thresholds, [position_y, position_x])
+    positions = positions.to_numpy().reshape(len(index), len(thresholds), 2)
+
+    rows = []
+    for k, (entry, exit) in enumerate(thresholds):
+        task_start = time.perf_counter()
+        pm = PortfolioManager(**portfolio_kwargs)
+        backtest = pm.backtest_arrays(
+            index = index,
+            coins = coins,
+            close_position = positions[:, k],
+            bid = bid,
+            ask = ask,
+            instant_execution = instant_execution
+        )
+        row = {
+            'entry_threshold': entry,
+            'exit_threshold': exit,
+            **{metric: backtest[metric] for metric in METRIC_COLUMNS},
+            'final_equity': backtest['summary_df']['PnL']['equity_curve'].iloc[-1],
+            'seconds': time.perf_counter() - task_start,
+            'pid': os.getpid(),
+        }
+        if keep_summaries:
+            row['summary_df'] = backtest['summary_df']
+        rows.append(row)
+    return rows
+
+def _run_task(hedge_lookback: int, spread_lookback: int, thresholds: List[Tuple[float, float]]) -> Tuple[List[Dict], Dict]:
+    '''Worker: z_score for one (hedge, spread) lookback, then positions and backtest for every threshold pair'''
+    start = time.perf_counter()
+    arrays, meta, index = _WORKER['arrays'], _WORKER['meta'], _WORKER['index']
+
+    spread = pd.Series(arrays[f'spread_{hedge_lookback}'], index = index)
+    beta = pd.Series(arrays[f'beta_{hedge_lookback}'], index = index)
+    z_score = PricingSignal(hedge_lookback = hedge_lookback, spread_lookback = spread_lookback)._calculate_zscore(spread)
+    rows = [
+        {'hedge_lookback': hedge_lookback, 'spread_lookback': spread_lookback, **row}
+        for row in backtest_thresholds(index, meta['coins'], z_score, beta, thresholds, arrays['bid'], arrays['ask'], meta['portfolio_kwargs'],
+                                       instant_execution = meta['instant_execution'], keep_summaries = meta['keep_summaries'])
+    ]
+
+    timing = {'hedge_lookback': hedge_lookback, 'spread_lookback': spread_lookback,
+              'n_backtests': len(thresholds), 'seconds': time.perf_counter() - start, 'pid': os.getpid()}
+    return rows, timing
+
+def run_grid_search(prices_df: pd.DataFrame,
+                    y_coin: str,
+                    x_coin: str,
+                    hedge_lookbacks: List[int],
+                    spread_lookbacks: List[int],
+                    entry_thresholds: List[float],
+                    exit_thresholds: List[float],
+                    portfolio_kwargs: Dict,
+                    signal_price: str = 'mid_price',
+                    instant_execution: bool = False,
+                    keep_summaries: bool = False,
+                    max_workers: int = None) -> Dict:
+    '''
+    Grid search over PricingSignal lookbacks and BollingerBandTradeStrategy thresholds.
+
+    Shared stages are computed once: the rolling OLS hedge ratio and spread once per hedge_lookback (in this process),
+    the z_score once per (hedge_lookback, spread_lookback) task. Tasks run in a process pool which reads prices,
+    spreads and betas from shared memory; each task backtests all threshold pairs with PortfolioManager.backtest_arrays.
+
+    Args:
+        prices_df: (coin, field) columns, with 'bid', 'ask' and signal_price fields for y_coin and x_coin
+        portfolio_kwargs: passed to PortfolioManager, e.g. {'trading_periods_per_year': ..., 'idealised': True}
+    Returns:
+        {'results': one row per parameter combination, 'timings': one row per task}
+    '''
+    coins = [y_coin, x_coin]
+    index = prices_df.index
+    #Skip combinations that exit before they enter, as in the notebook grid search
+    thresholds = [(float(entry), float(exit)) for entry, exit in itertools.product(entry_thresholds, exit_thresholds) if exit < entry]
+
+    #portfolio_kwargs['precision'] = 'compact' also halves the shared arrays
+    dtypes = PRECISION_DTYPES[portfolio_kwargs.get('precision', 'float64')]
+    arrays = {
+        'index': index.asi8,
+        'bid': prices_df.xs('bid', axis = 1, level = 1)[coins].to_numpy(dtype = dtypes['price']),
+        'ask': prices_df.xs('ask', axis = 1, level = 1)[coins].to_numpy(dtype = dtypes['price']),
+    }
+    y, x = prices_df[y_coin][signal_price], prices_df[x_coin][signal_price]
+    for hedge_lookback in tqdm(hedge_lookbacks, desc = 'hedge ratios'):
+        signal = PricingSignal(hedge_lookback = hedge_lookback, spread_lookback = None)
+        intercept, beta = signal._calculate_hedge_ratio(x, y)
+        arrays[f'spread_{hedge_lookback}'] = signal._calculate_spread(x, y, intercept, beta).to_numpy(dtype = dtypes['signal'])
+        arrays[f'beta_{hedge_lookback}'] = beta.to_numpy(dtype = dtypes['signal'])
+
+    meta = {
+        'coins': coins,
+        'tz': index.tz,
+        'index_dtype': f'datetime64[{index.unit}]',
+        'portfolio_kwargs': portfolio_kwargs,
+        'instant_execution': instant_execution,
+        'keep_summaries': keep_summaries,
+    }
+    rows, timings = [], []
+    with SharedArrays(arrays) as shared, ProcessPoolExecutor(max_workers = max_workers, initializer = _init_worker, initargs = (shared.specs, meta)) as pool:
+        futures = [pool.submit(_run_task, hedge_lookback, spread_lookback, thresholds)
+                   for hedge_lookback, spread_lookback in itertools.product(hedge_lookbacks, spread_lookbacks)]
+        for future in tqdm(as_completed(futures), total = len(futures), desc = 'backtests'):
+            task_rows, timing = future.result()
+            rows.extend(task_rows)
+            timings.append(timing)
+
+    results = pd.DataFrame(rows).set_index(['hedge_lookback', 'spread_lookback', 'entry_threshold', 'exit_threshold']).sort_index()
+    return {
+        'results': results,
+        'timings': pd.DataFrame(timings),
+    }
@@ -1,11 +1,14 @@
 
 SECONDS_TO_MINUTES = 60
 
+from typing import NamedTuple
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm 
 from itertools import combinations
 
+from rolling_ols import rolling_ols
+
 def fit_spread(y: pd.Series, x: pd.Series) -> pd.Series: 
     x_with_constant = sm.add_constant(x)
     results = sm.OLS(y, x_with_constant, missing='drop').fit()  # ← Add this
@@ -20,102 +23,135 @@ def rel_positions(spread: pd.Series) -> pd.Series:
     position_values = np.select(conditions, values)
     return pd.Series(position_values, index = spread.index)    
 
-def zero_crossings(spread: pd.Series) -> pd.Series:
-    '''Return vector of times between zero crossings from global mu'''
-    mu = spread.mean()
-    demeaned_spread = spread - mu 
-    signs = pd.Series(np.sign(demeaned_spread), index = spread.index)
-    #Filter to cases where we are either strictly ABOVE or strictly BELOW the mean 
-    above_below = signs[signs!=0]
-    crossings = above_below.diff().loc[lambda x: x!=0].dropna()
-    interarrival_times = crossings.index.to_series().diff().dt.total_seconds() / SECONDS_TO_MINUTES
-    #hanging - time from last crossing 
-    last_crossing_time = crossings.index[-1]
-    time_since_last_crossing = (spread.index[-1] - last_crossing_time).total_seconds()/SECONDS_TO_MINUTES
-    return crossings, interarrival_times.dropna(), time_since_last_crossing
+CROSSING_MODES = ['mean', 'std_buffer', 'percentile', 'rolling_vol']
 
-def zero_crossings_with_buffer(spread: pd.Series, buffer_std: float = 1.0) -> tuple:
-    '''Zero crossings with buffer zone around mean'''
-    mu = spread.mean()
-    sigma = spread.std()
-    
-    # Define buffer zone
-    upper_threshold = mu + buffer_std * sigma
-    lower_threshold = mu - buffer_std * sigma
-    
-    # Classify: +1 above upper, -1 below lower, 0 in buffer
-    signs = pd.Series(0, index=spread.index)
-    signs[spread > upper_threshold] = 1
-    signs[spread < lower_threshold] = -1
+class CrossingStats(NamedTuple): 
+    '''
+    Crossing events for many (column, mode) series, stored flat: events of series k are [offsets[k], offsets[k+1])
     
-    # Rest of your code
-    above_below = signs[signs != 0]
-    crossings = above_below.diff().loc[lambda x: x != 0].dropna()
-    
-    if len(crossings) == 0:
-        return crossings, pd.Series(dtype=float), np.nan
-    
-    interarrival_times = crossings.index.to_series().diff().dt.total_seconds() / SECONDS_TO_MINUTES
-    last_crossing_time = crossings.index[-1]
-    time_since_last = (spread.index[-1] - last_crossing_time).total_seconds() / SECONDS_TO_MINUTES
-    
-    return crossings, interarrival_times.dropna(), time_since_last
+    Fields: 
+        keys: (column, mode) label of each series 
+        offsets: (n_series + 1,) start of each series in the flat arrays 
+        times: int64 ns timestamps of each crossing 
+        signs: +1 crossed to above the upper threshold, -1 crossed to below the lower threshold 
+        interarrival_minutes: minutes since the previous crossing of the same series (NaN for the first)
+        time_since_last_minutes: (n_series,) minutes from the last crossing to the end of the data (NaN if no crossings)
+    '''
+    keys: list
+    offsets: np.ndarray
+    times: np.ndarray
+    signs: np.ndarray
+    interarrival_minutes: np.ndarray
+    time_since_last_minutes: np.ndarray
 
-def zero_crossings_percentile(spread: pd.Series, percentile: float = 0.10) -> tuple:
-    '''Use percentiles instead of std (more robust to outliers)'''
-    #Step 1 - Demean teh spread 
-    spread = spread - spread.mean()
+    def _slice(self, column, mode) -> slice: 
+        k = self.keys.index((column, mode))
+        return slice(self.offsets[k], self.offsets[k + 1])
 
-    # Upper/lower thresholds at percentiles
-    upper_threshold = spread.quantile(0.5 + percentile)
-    lower_threshold = spread.quantile(0.5 - percentile)
-    
-    signs = pd.Series(0, index=spread.index)
-    signs[spread > upper_threshold] = 1
-    signs[spread < lower_threshold] = -1
+    def crossings(self, column, mode = 'mean') -> pd.Series: 
+        '''Same as the crossings returned by zero_crossings_*: sign diff (+/-2) indexed by crossing time'''
+        events = self._slice(column, mode)
+        return pd.Series(2.0 * self.signs[events], index = pd.DatetimeIndex(self.times[events]))
 
-    above_below = signs[signs != 0]
-    crossings = above_below.diff().loc[lambda x: x != 0].dropna()
-    
-    if len(crossings) == 0:
+    def interarrival_times(self, column, mode = 'mean') -> pd.Series: 
+        events = self._slice(column, mode)
+        return pd.Series(self.interarrival_minutes[events][1:], index = pd.DatetimeIndex(self.times[events][1:]))
+
+    def time_since_last(self, column, mode = 'mean') -> float: 
+        return self.time_since_last_minutes[self.keys.index((column, mode))]
+
+def _crossing_signs(spreads: pd.DataFrame, mode: str, buffer_std: float, percentile: float, 
+                    vol_window: int, buffer_multiplier: float) -> np.ndarray: 
+    '''(n_periods, n_columns) int8: +1 above the upper threshold, -1 below the lower threshold, 0 in between or NaN'''
+    values = spreads.to_numpy(dtype = float)
+    mu = np.nanmean(values, axis = 0)
+    if mode == 'mean': 
+        upper = lower = mu
+    elif mode == 'std_buffer': 
+        sigma = np.nanstd(values, axis = 0, ddof = 1)
+        upper, lower = mu + buffer_std * sigma, mu - buffer_std * sigma
+    elif mode == 'percentile': 
+        #Thresholds on the demeaned spread at 0.5 +/- percentile 
+        values = values - mu
+        upper = np.nanquantile(values, 0.5 + percentile, axis = 0)
+        lower = np.nanquantile(values, 0.5 - percentile, axis = 0)
+    elif mode == 'rolling_vol': 
+        rolling_std = spreads.rolling(vol_window).std().to_numpy()
+        upper, lower = mu + buffer_multiplier * rolling_std, mu - buffer_multiplier * rolling_std
+    else: 
+        raise ValueError(f"mode must be one of {CROSSING_MODES}, got {mode}")
+    with np.errstate(invalid = 'ignore'): 
+        return (values > upper).astype(np.int8) - (values < lower).astype(np.int8)
+
+def crossing_stats(spreads, 
+                   modes = ('mean',), 
+                   buffer_std: float = 1.0, 
+                   percentile: float = 0.10, 
+                   vol_window: int = 100, 
+                   buffer_multiplier: float = 1.0) -> CrossingStats: 
+    '''
+    Crossing events for every column of spreads and every threshold mode in one vectorised pass. 
+
+    A crossing is a change of side (above upper / below lower threshold), ignoring periods in between. 
+    Modes (same thresholds as the zero_crossings_* family): 
+        'mean': global mean (zero_crossings)
+        'std_buffer': mean +/- buffer_std * std (zero_crossings_with_buffer)
+        'percentile': 0.5 +/- percentile quantiles of the demeaned spread (zero_crossings_percentile)
+        'rolling_vol': mean +/- buffer_multiplier * rolling std over vol_window (zero_crossings_adaptive)
+    '''
+    spreads = spreads.to_frame() if isinstance(spreads, pd.Series) else spreads
+    times = spreads.index.values.astype('datetime64[ns]').view(np.int64)
+    keys = [(column, mode) for mode in modes for column in spreads.columns]
+    signs = np.concatenate([_crossing_signs(spreads, mode, buffer_std, percentile, vol_window, buffer_multiplier) for mode in modes], axis = 1)
+
+    #Non zero signs of all series, ordered by series then time 
+    series_idx, row_idx = np.nonzero(signs.T)
+    side = signs[row_idx, series_idx]
+    is_crossing = np.zeros(len(side), dtype = bool)
+    is_crossing[1:] = (side[1:] != side[:-1]) & (series_idx[1:] == series_idx[:-1])
+
+    crossing_series, crossing_rows = series_idx[is_crossing], row_idx[is_crossing]
+    offsets = np.searchsorted(crossing_series, np.arange(len(keys) + 1))
+    crossing_times = times[crossing_rows]
+
+    interarrival = np.full(len(crossing_times), np.nan)
+    interarrival[1:] = np.diff(crossing_times) / 1e9 / SECONDS_TO_MINUTES
+    interarrival[offsets[:-1][offsets[:-1] < len(crossing_times)]] = np.nan
+
+    time_since_last = np.full(len(keys), np.nan)
+    has_crossing = offsets[1:] > offsets[:-1]
+    time_since_last[has_crossing] = (times[-1] - crossing_times[offsets[1:][has_crossing] - 1]) / 1e9 / SECONDS_TO_MINUTES
+
+    return CrossingStats(keys, offsets, crossing_times, side[is_crossing], interarrival, time_since_last)
+
+def _crossings_tuple(spread: pd.Series, mode: str, **kwargs) -> tuple: 
+    stats = crossing_stats(spread.rename('spread'), modes = (mode,), **kwargs)
+    crossings = stats.crossings('spread', mode)
+    if len(crossings) == 0: 
         return crossings, pd.Series(dtype=float), np.nan
-    
-    interarrival_times = crossings.index.to_series().diff().dt.total_seconds() / SECONDS_TO_MINUTES
-    last_crossing_time = crossings.index[-1]
-    time_since_last = (spread.index[-1] - last_crossing_time).total_seconds() / SECONDS_TO_MINUTES
+    return crossings, stats.interarrival_times('spread', mode), stats.time_since_last('spread', mode)
+
+def zero_crossings(spread: pd.Series) -> tuple:
+    '''Return vector of times between zero crossings from global mu'''
+    return _crossings_tuple(spread, 'mean')
+
+def zero_crossings_with_buffer(spread: pd.Series, buffer_std: float = 1.0) -> tuple:
+    '''Zero crossings with buffer zone around mean'''
+    return _crossings_tuple(spread, 'std_buffer', buffer_std = buffer_std)
 
-    return crossings, interarrival_times.dropna(), time_since_last
+def zero_crossings_percentile(spread: pd.Series, percentile: float = 0.10) -> tuple:
+    '''Use percentiles instead of std (more robust to outliers)'''
+    return _crossings_tuple(spread, 'percentile', percentile = percentile)
     
 def zero_crossings_adaptive(spread: pd.Series, 
                            vol_window: int = 100,
                            buffer_multiplier: float = 1.0) -> tuple:
     '''Buffer adapts to recent volatility'''
-    mu = spread.mean()
-    rolling_std = spread.rolling(vol_window).std()
-    
-    # Adaptive thresholds based on recent vol
-    upper_threshold = mu + buffer_multiplier * rolling_std
-    lower_threshold = mu - buffer_multiplier * rolling_std
-    
-    signs = pd.Series(0, index=spread.index)
-    signs[spread > upper_threshold] = 1
-    signs[spread < lower_threshold] = -1
-
-    above_below = signs[signs != 0]
-    crossings = above_below.diff().loc[lambda x: x != 0].dropna()
-    
-    if len(crossings) == 0:
-        return crossings, pd.Series(dtype=float), np.nan
-    
-    interarrival_times = crossings.index.to_series().diff().dt.total_seconds() / SECONDS_TO_MINUTES
-    last_crossing_time = crossings.index[-1]
-    time_since_last = (spread.index[-1] - last_crossing_time).total_seconds() / SECONDS_TO_MINUTES
-
-    return crossings, interarrival_times.dropna(), time_since_last
+    return _crossings_tuple(spread, 'rolling_vol', vol_window = vol_window, buffer_multiplier = buffer_multiplier)
 
-def quantile_crossing_time(spread: pd.Series, q = 0.5) -> pd.Series: 
-    _, interarrival_times = zero_crossings(spread)
-    if interarrival_times: 
+def quantile_crossing_time(spread: pd.Series, q = 0.5) -> float: 
+    _, interarrival_times, _ = zero_crossings(spread)
+    if len(interarrival_times): 
         return np.quantile(interarrival_times, q = q)
     else: 
         return np.inf 
@@ -165,6 +201,74 @@ def ssd_distance(prices_df):
 
     return results_df
 
+def ssd_distance_matrix(prices_df: pd.DataFrame, 
+                        top_k: int = None, 
+                        chunk_size: int = 256, 
+                        dtype = np.float64) -> pd.DataFrame: 
+    """
+    Vectorised ssd_distance: all pairwise SSDs of cumulative returns from Gram matrix identities, 
+    sum_t (a_i - a_j)^2 = |a_i|^2 + |a_j|^2 - 2 a_i.a_j, computed in blocks of chunk_size coins. 
+    
+    Parameters:
+    -----------
+    prices_df : DataFrame
+        Price data with coins as columns, timestamps as index. NaN gaps are allowed: each pair is 
+        compared over the timestamps where both coins have a price 
+    top_k : int
+        Only keep the top_k closest pairs (never materialises the full pair table)
+    dtype : 
+        np.float32 halves memory for large panels, np.float64 (default) for exact rankings 
+    Returns:
+    --------
+    DataFrame with pairs ranked by SSD distance, same columns as ssd_distance
+    """
+    coins = np.asarray(prices_df.columns)
+    prices = prices_df.to_numpy(dtype = dtype)
+    #Normalise by the first valid price of each coin (same as prices_df.iloc[0] when there are no gaps)
+    first_price = prices_df.bfill().iloc[0].to_numpy(dtype = dtype)
+    valid = ~np.isnan(prices)
+    #Cumulative returns start at 1, shift by -1 to keep the Gram terms small (differences are unchanged)
+    returns = np.where(valid, prices / first_price - 1, 0).astype(dtype)
+    returns_sq = returns * returns
+    valid = valid.astype(dtype)
+
+    best_i, best_j, best_distance = [], [], []
+    n_coins = len(coins)
+    for start in range(0, n_coins, chunk_size): 
+        stop = min(start + chunk_size, n_coins)
+        #(chunk, n_coins) blocks, each term only counts timestamps where both coins are valid 
+        cross = returns[:, start:stop].T @ returns
+        sq_i = returns_sq[:, start:stop].T @ valid
+        sq_j = valid[:, start:stop].T @ returns_sq
+        n_obs = valid[:, start:stop].T @ valid
+        with np.errstate(invalid = 'ignore', divide = 'ignore'): 
+            distance = np.maximum(sq_i + sq_j - 2 * cross, 0) / n_obs
+
+        #Upper triangle only: pairs (i, j) with j > i 
+        rows, cols = np.nonzero(np.arange(n_coins)[None, :] > np.arange(start, stop)[:, None])
+        distance = distance[rows, cols]
+        keep = ~np.isnan(distance)
+        best_i.append(rows[keep] + start)
+        best_j.append(cols[keep])
+        best_distance.append(distance[keep])
+
+        if top_k is not None: 
+            #Merge with the best so far and keep the k smallest 
+            best_i, best_j, best_distance = [np.concatenate(best) for best in (best_i, best_j, best_distance)]
+            if len(best_distance) > top_k: 
+                smallest = np.argpartition(best_distance, top_k - 1)[:top_k]
+                best_i, best_j, best_distance = best_i[smallest], best_j[smallest], best_distance[smallest]
+            best_i, best_j, best_distance = [best_i], [best_j], [best_distance]
+
+    best_i, best_j, best_distance = [np.concatenate(best) for best in (best_i, best_j, best_distance)]
+    results_df = pd.DataFrame({
+        'coin1': coins[best_i], 
+        'coin2': coins[best_j], 
+        'distance': best_distance.astype(np.float64), 
+    }).sort_values('distance', kind = 'stable')
+    results_df['rank_ssd'] = range(1, len(results_df) + 1)
+    return results_df
+
 def calculate_rolling_ols_spread_fast(df: pd.DataFrame, 
                                        asset_a: str, 
                                        asset_b: str, 
@@ -172,26 +276,11 @@ def calculate_rolling_ols_spread_fast(df: pd.DataFrame,
     """
     Rolling OLS with intercept: y = alpha + beta * x
     """
-    x = df[asset_b]
-    y = df[asset_a]
-    
-    # Rolling means
-    x_mean = x.rolling(window).mean()
-    y_mean = y.rolling(window).mean()
-    
-    # beta = cov(x,y) / var(x)
-    cov_xy = y.rolling(window).cov(x)
-    var_x = x.rolling(window).var()
-    betas = cov_xy / var_x
-    
-    # alpha = mean(y) - beta * mean(x)
-    alphas = y_mean - betas * x_mean
-    
-    # spread = y - (alpha + beta * x)
-    spread = y - (alphas + betas * x)
+    #Single pass kernel - replaces four separate pandas rolling passes 
+    ols = rolling_ols(x = df[asset_b], y = df[asset_a], window = window)
     
     return pd.DataFrame({
-        'beta': betas, 
-        'alpha': alphas,
-        'spread': spread
+        'beta': ols['beta'], 
+        'alpha': ols['intercept'],
+        'spread': ols['spread']
     }, index=df.index)
\ No newline at end of file
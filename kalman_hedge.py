@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from numba_compat import NUMBA_AVAILABLE, njit
+
+DEFAULT_DELTA = 1e-4
+DEFAULT_OBSERVATION_VARIANCE = 1e-3
+
+@njit(cache = True)
+def _kalman_kernel(x, y, state_variance, observation_variance, initial_variance, fit_intercept, warmup):
+    '''
+    Kalman filter of y = intercept + beta * x with (intercept, beta) a random walk, over a stack of pairs.
+
+    x, y are (n_bars, n_pairs); each bar is one predict + update step per pair, with the symmetric 2x2 state covariance
+    kept as three arrays (p00, p01, p11) updated in closed form. Pairs with NaN x or y at a bar skip the update (the
+    covariance still grows by the state noise). Without an intercept its variance stays 0, so it never moves from 0.
+    '''
+    n, m = x.shape
+    intercept = np.full((n, m), np.nan)
+    beta = np.full((n, m), np.nan)
+    intercept_variance = state_variance if fit_intercept else 0.0
+    a = np.zeros(m)
+    b = np.zeros(m)
+    p00 = np.full(m, initial_variance if fit_intercept else 0.0)
+    p01 = np.zeros(m)
+    p11 = np.full(m, initial_variance)
+    nobs = np.zeros(m)
+    min_nobs = 2 if fit_intercept else 1
+    for i in range(n):
+        for j in range(m):
+            #Predict: the state is a random walk, its covariance grows by the state noise
+            p00[j] += intercept_variance
+            p11[j] += state_variance
+
+            #Update with H = [1, x]: S = H P H' + Ve, K = P H' / S, P -= K H P
+            x_ij = x[i, j]
+            y_ij = y[i, j]
+            if not (np.isnan(x_ij) or np.isnan(y_ij)):
+                ph0 = p00[j] + p01[j] * x_ij
+                ph1 = p01[j] + p11[j] * x_ij
+                s = ph0 + ph1 * x_ij + observation_variance
+                k0 = ph0 / s
+                k1 = ph1 / s
+                error = y_ij - a[j] - b[j] * x_ij
+                a[j] += k0 * error
+                b[j] += k1 * error
+                p00[j] -= k0 * ph0
+                p01[j] -= k0 * ph1
+                p11[j] -= k1 * ph1
+                nobs[j] += 1
+
+            if i >= warmup - 1 and nobs[j] >= min_nobs:
+                intercept[i, j] = a[j]
+                beta[i, j] = b[j]
+    return intercept, beta
+
+def _kalman_vectorised(x, y, state_variance, observation_variance, initial_variance, fit_intercept, warmup):
+    '''
+    _kalman_kernel with each bar's step as array operations across all pairs, for when numba is not installed
+    (a per pair Python loop would be far slower). Same arithmetic, so the results agree.
+    '''
+    n, m = x.shape
+    intercept = np.full((n, m), np.nan)
+    beta = np.full((n, m), np.nan)
+    intercept_variance = state_variance if fit_intercept else 0.0
+    a, b = np.zeros(m), np.zeros(m)
+    p00 = np.full(m, initial_variance if fit_intercept else 0.0)
+    p01 = np.zeros(m)
+    p11 = np.full(m, initial_variance)
+    nobs = np.zeros(m)
+    min_nobs = 2 if fit_intercept else 1
+    for i in range(n):
+        p00 += intercept_variance
+        p11 += state_variance
+        valid = ~(np.isnan(x[i]) | np.isnan(y[i]))
+        x_i = np.where(valid, x[i], 0.0)
+        ph0 = p00 + p01 * x_i
+        ph1 = p01 + p11 * x_i
+        s = ph0 + ph1 * x_i + observation_variance
+        #Gain 0 where the observation is missing, so state and covariance keep their predicted values
+        k0 = np.where(valid, ph0 / s, 0.0)
+        k1 = np.where(valid, ph1 / s, 0.0)
+        error = np.where(valid, y[i] - a - b * x_i, 0.0)
+        a += k0 * error
+        b += k1 * error
+        p00 -= k0 * ph0
+        p01 -= k0 * ph1
+        p11 -= k1 * ph1
+        nobs += valid
+
+        if i >= warmup - 1:
+            ready = nobs >= min_nobs
+            intercept[i] = np.where(ready, a, np.nan)
+            beta[i] = np.where(ready, b, np.nan)
+    return intercept, beta
+
+def kalman_hedge_arrays(x: np.ndarray, y: np.ndarray, delta: float = DEFAULT_DELTA,
+                        observation_variance: float = DEFAULT_OBSERVATION_VARIANCE, warmup: int = 1,
+                        fit_intercept: bool = True, initial_variance: float = 1.0):
+    '''
+    Filtered (intercept, beta) of every pair in one pass, O(1) per bar and pair.
+
+    Args:
+        x, y: (n_bars,) or (n_bars, n_pairs) prices, column j of y regressed on column j of x
+        delta: state noise, (intercept, beta) drift with covariance delta / (1 - delta) * I per bar. Larger adapts faster
+        observation_variance: variance of the regression residual
+        warmup: the first warmup - 1 bars are NaN, as the first window - 1 bars of a rolling regression
+        initial_variance: prior variance of intercept and beta, which start at 0
+    Returns:
+        (intercept, beta) arrays shaped as x
+    '''
+    x, y = np.asarray(x, dtype = float), np.asarray(y, dtype = float)
+    squeeze = x.ndim == 1
+    x2, y2 = (x[:, None], y[:, None]) if squeeze else (x, y)
+    kernel = _kalman_kernel if NUMBA_AVAILABLE else _kalman_vectorised
+    intercept, beta = kernel(np.ascontiguousarray(x2), np.ascontiguousarray(y2), delta / (1.0 - delta),
+                             float(observation_variance), float(initial_variance), fit_intercept, int(warmup))
+    return (intercept[:, 0], beta[:, 0]) if squeeze else (intercept, beta)
+
+def kalman_hedge(x, y, delta: float = DEFAULT_DELTA, observation_variance: float = DEFAULT_OBSERVATION_VARIANCE,
+                 warmup: int = 1, fit_intercept: bool = True):
+    '''
+    Kalman filter hedge ratio of y on x, a time varying alternative to rolling_ols without a lookback to tune.
+
+    x, y: Series (one pair, returns a DataFrame with ['intercept', 'beta', 'spread'] as rolling_ols) or DataFrames with
+    one column per pair (returns {'intercept', 'beta', 'spread'} DataFrames labelled as y)
+    '''
+    if isinstance(x, pd.Series):
+        x_arr, y_arr = x.to_numpy(dtype = float), y.reindex(x.index).to_numpy(dtype = float)
+        intercept, beta = kalman_hedge_arrays(x_arr, y_arr, delta, observation_variance, warmup, fit_intercept)
+        return pd.DataFrame({'intercept': intercept, 'beta': beta, 'spread': y_arr - intercept - beta * x_arr}, index = x.index)
+
+    x_arr, y_arr = x.to_numpy(dtype = float), y.reindex(x.index).to_numpy(dtype = float)
+    intercept, beta = kalman_hedge_arrays(x_arr, y_arr, delta, observation_variance, warmup, fit_intercept)
+    return {
+        name: pd.DataFrame(values, index = x.index, columns = y.columns)
+        for name, values in [('intercept', intercept), ('beta', beta), ('spread', y_arr - intercept - beta * x_arr)]
+    }
@@ -0,0 +1,187 @@
+import time
+import asyncio
+from typing import AsyncIterator, Dict, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from portfolio_manager.constants import DEFAULT_HOURLY_INTEREST_RATE
+from portfolio_manager.transaction_costs import CostCalculator
+from pricing_signals import OnlinePricingSignal
+from trading_strategy import OnlineBollingerBandTradeStrategy
+
+LATENCY_PERCENTILES = [50, 90, 99, 99.9]
+
+class QuoteEvent(NamedTuple):
+    '''Level 1 quote update for one coin'''
+    timestamp: pd.Timestamp
+    coin: str
+    bid: float
+    ask: float
+
+class Fill(NamedTuple):
+    timestamp: pd.Timestamp
+    coin: str
+    quantity: float
+    price: float
+    fee: float
+
+class SimulatedExchange:
+    '''
+    In-process stand-in for a venue: market orders fill in full at the current ask (buy) or bid (sell), with spot fees
+    and borrow interest from CostCalculator rates.
+
+    Interest accrues time weighted (CostCalculator 'time_weighted'): between quote updates a short position pays
+    units * max(bid, ask) * hourly rate * hours elapsed. latency_seconds delays every fill, to stand in for the venue round trip.
+    '''
+    def __init__(self, costs: CostCalculator, initial_capital: float = 10_000, latency_seconds: float = 0.0):
+        self.costs = costs
+        self.initial_capital = initial_capital
+        self.latency_seconds = latency_seconds
+        self.cash = initial_capital
+        self.positions: Dict[str, float] = {}
+        self.quotes: Dict[str, tuple] = {} #coin -> (timestamp, bid, ask)
+        self.fees = 0.0
+        self.interest = 0.0
+        self.fills: List[Fill] = []
+
+    def on_quote(self, event: QuoteEvent):
+        previous = self.quotes.get(event.coin)
+        position = self.positions.get(event.coin, 0.0)
+        if previous is not None and position < 0:
+            timestamp, bid, ask = previous
+            hours = (event.timestamp - timestamp) / pd.Timedelta(hours = 1)
+            rate = self.costs.hourly_interest_rate_by_coin.get(event.coin, DEFAULT_HOURLY_INTEREST_RATE)
+            self.interest += -position * max(bid, ask) * rate * hours
+        self.quotes[event.coin] = (event.timestamp, event.bid, event.ask)
+
+    async def submit_order(self, coin: str, quantity: float) -> Fill:
+        '''Market order, quantity > 0 buys'''
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        timestamp, bid, ask = self.quotes[coin]
+        #buy long = ask, sell = bid
+        price = ask if quantity > 0 else bid
+        fee = abs(quantity * price) * self.costs.transaction_cost_rate
+        self.cash -= quantity * price + fee
+        self.fees += fee
+        self.positions[coin] = self.positions.get(coin, 0.0) + quantity
+        fill = Fill(timestamp, coin, quantity, price, fee)
+        self.fills.append(fill)
+        return fill
+
+    def equity(self) -> float:
+        '''Cash less accrued interest plus positions marked to close: shorts at the ask, longs at the bid'''
+        value = sum(position * self.quotes[coin][2 if position < 0 else 1] for coin, position in self.positions.items() if position != 0)
+        return self.cash - self.interest + value
+
+class LiveTrader:
+    '''
+    Asyncio runtime for one pair: consumes quote events, updates OnlinePricingSignal and the strategy bar by bar, and
+    trades the change in target positions on the exchange.
+
+    With bar_freq set, a bar closes at the first event of the next bar: the signal is computed on the mid prices of the
+    last quotes and orders fill at those quotes (as PortfolioManager.backtest with instant_execution = True).
+    With bar_freq = None a bar is one timestamp of the quote stream (one row of the replayed panel): it closes as soon as
+    every coin has quoted at that timestamp, or at the next timestamp if a coin did not, with that coin's price NaN as in
+    the batch panel. Decision latency (event received -> all orders filled) is recorded per bar.
+    '''
+    def __init__(self,
+                 y_coin: str,
+                 x_coin: str,
+                 signal: OnlinePricingSignal,
+                 strategy: OnlineBollingerBandTradeStrategy,
+                 exchange: SimulatedExchange,
+                 bar_freq: str = None):
+        self.coins = [y_coin, x_coin]
+        self.signal = signal
+        self.strategy = strategy
+        self.exchange = exchange
+        self.bar_freq = bar_freq
+        self._bar = None
+        self._quoted = set() #coins quoted in the open bar, bar_freq = None only
+        self.latencies_ns: List[int] = []
+        self.records: List[dict] = []
+
+    async def run(self, events: AsyncIterator[QuoteEvent]):
+        async for event in events:
+            await self.on_quote(event)
+        await self.close()
+
+    async def on_quote(self, event: QuoteEvent):
+        received_ns = time.perf_counter_ns()
+        if self.bar_freq is not None:
+            bar = event.timestamp.floor(self.bar_freq)
+            if self._bar is not None and bar != self._bar:
+                await self._on_bar_close(self._bar, received_ns)
+            self._bar = bar
+            self.exchange.on_quote(event)
+        else:
+            if self._bar is not None and event.timestamp != self._bar:
+                await self._on_bar_close(self._bar, received_ns)
+            self._bar = event.timestamp
+            self._quoted.add(event.coin)
+            self.exchange.on_quote(event)
+            if self._quoted.issuperset(self.coins):
+                await self._on_bar_close(self._bar, received_ns)
+
+    async def close(self):
+        '''Close the last open bar at the end of the stream'''
+        if self._bar is not None:
+            await self._on_bar_close(self._bar, time.perf_counter_ns())
+
+    def _mid(self, coin: str) -> float:
+        if self.bar_freq is None and coin not in self._quoted:
+            return np.nan
+        _, bid, ask = self.exchange.quotes[coin]
+        return (bid + ask) / 2
+
+    async def _on_bar_close(self, bar: pd.Timestamp, received_ns: int):
+        self._bar = None
+        quotes = self.exchange.quotes
+        if self.bar_freq is not None and any(coin not in quotes for coin in self.coins):
+            return
+        z_score, spread, beta = self.signal.update(self._mid(self.coins[1]), self._mid(self.coins[0]))
+        self._quoted = set()
+        targets = self.strategy.update(z_score, beta)
+
+        orders = []
+        for coin, target in zip(self.coins, targets):
+            #NaN beta during warm up keeps the current position
+            quantity = target - self.exchange.positions.get(coin, 0.0)
+            if np.isfinite(quantity) and quantity != 0:
+                orders.append(self.exchange.submit_order(coin, quantity))
+        if orders:
+            await asyncio.gather(*orders)
+        self.latencies_ns.append(time.perf_counter_ns() - received_ns)
+        self.records.append({'timestamp': bar, 'z_score': z_score, 'spread': spread, 'beta': beta,
+                             'position_y': targets[0], 'position_x': targets[1], 'equity': self.exchange.equity()})
+
+    def latency_report(self) -> pd.Series:
+        '''Decision latency percentiles in microseconds'''
+        latencies_us = np.asarray(self.latencies_ns) / 1e3
+        if not len(latencies_us):
+            return pd.Series(dtype = float)
+        report = {f'p{percentile:g}': np.percentile(latencies_us, percentile) for percentile in LATENCY_PERCENTILES}
+        return pd.Series({'n_decisions': len(latencies_us), 'mean': latencies_us.mean(), **report, 'max': latencies_us.max()})
+
+    def records_df(self) -> pd.DataFrame:
+        return pd.DataFrame(self.records).set_index('timestamp')
+
+async def replay_quotes(prices_df: pd.DataFrame, coins: List[str], speed: float = None) -> AsyncIterator[QuoteEvent]:
+    '''
+    Quote events from a (coin, field) bid/ask panel, one per coin and row in time order.
+    speed: replay faster than real time by this factor (None = as fast as possible, yielding to the loop between rows)
+    '''
+    bid = prices_df.xs('bid', axis = 1, level = 1)[coins].to_numpy(dtype = float)
+    ask = prices_df.xs('ask', axis = 1, level = 1)[coins].to_numpy(dtype = float)
+    previous = None
+    for i, timestamp in enumerate(prices_df.index):
+        if speed is not None and previous is not None:
+            await asyncio.sleep((timestamp - previous).total_seconds() / speed)
+        else:
+            await asyncio.sleep(0)
+        previous = timestamp
+        for j, coin in enumerate(coins):
+            if not (np.isnan(bid[i, j]) or np.isnan(ask[i, j])):
+                yield QuoteEvent(timestamp, coin, bid[i, j], ask[i, j])
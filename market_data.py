@@ -0,0 +1,259 @@
+import os
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+#field name in the store -> column in the level 1 resampled parquet
+DEFAULT_FIELDS = {
+    'bid': 'bid_0_price',
+    'ask': 'ask_0_price',
+    'bid_size': 'bid_0_size',
+    'ask_size': 'ask_0_size',
+    'mid_price': 'mid_price',
+}
+
+class PriceWindow:
+    '''
+    Prices for some coins over [start, end], backed by memory-mapped partitions.
+
+    view(coin, field) is a zero-copy view when the window lies within one day partition.
+    The (n_periods, n_coins) arrays for the backtester and the MultiIndex frame are only built when requested.
+    '''
+    def __init__(self, index: pd.DatetimeIndex, coins: List[str], pieces: Dict[tuple, list], day_lengths: List[int]):
+        self.index = index
+        self.coins = coins
+        #(coin, field) -> one array per day: a memory-mapped slice, or None for a missing partition
+        self._pieces = pieces
+        self._day_lengths = day_lengths
+        self._arrays = {}
+
+    def view(self, coin: str, field: str) -> np.ndarray:
+        '''Prices of one coin and field, zero-copy within a single day partition'''
+        pieces = self._pieces[(coin, field)]
+        if len(pieces) == 1 and pieces[0] is not None:
+            return pieces[0]
+        return np.concatenate([np.full(length, np.nan) if piece is None else piece
+                               for piece, length in zip(pieces, self._day_lengths)])
+
+    def array(self, field: str) -> np.ndarray:
+        '''(n_periods, n_coins) array of field, columns ordered as coins (one copy, cached)'''
+        if field not in self._arrays:
+            out = np.empty((len(self.index), len(self.coins)))
+            for j, coin in enumerate(self.coins):
+                row = 0
+                for piece, length in zip(self._pieces[(coin, field)], self._day_lengths):
+                    out[row: row + length, j] = np.nan if piece is None else piece
+                    row += length
+            self._arrays[field] = out
+        return self._arrays[field]
+
+    @property
+    def bid(self) -> np.ndarray:
+        return self.array('bid')
+
+    @property
+    def ask(self) -> np.ndarray:
+        return self.array('ask')
+
+    def to_frame(self, fields: List[str] = None) -> pd.DataFrame:
+        '''(coin, field) MultiIndex frame as consumed by PortfolioManager.backtest'''
+        fields = fields or list(dict.fromkeys(field for _, field in self._pieces))
+        return pd.concat({
+            coin: pd.DataFrame({field: self.view(coin, field) for field in fields}, index = self.index)
+            for coin in self.coins
+        }, axis = 1)
+
+class MarketDataStore:
+    '''
+    Level 1 bid/ask panel stored as one .npy file per (coin, day, field) on a fixed time grid:
+        root/coin=ADA-USDT/date=2025-04-01/bid.npy
+
+    Reads only open the partitions for the requested coins and days (memory-mapped) and slice them to the time range,
+    so a single pair backtest touches two coins' files for the window it needs.
+    '''
+    def __init__(self, root: str, freq: str = '10s'):
+        self.root = root
+        meta_path = os.path.join(root, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                freq = json.load(f)['freq']
+        self.freq = freq
+
+    def _day_grid(self, day: pd.Timestamp) -> pd.DatetimeIndex:
+        return pd.date_range(day, day + pd.Timedelta(days = 1), freq = self.freq, inclusive = 'left')
+
+    def _partition_dir(self, coin: str, day: pd.Timestamp) -> str:
+        return os.path.join(self.root, f'coin={coin}', f'date={day.date().isoformat()}')
+
+    def write(self, df: pd.DataFrame, symbol_column: str = 'symbol', fields: Dict[str, str] = DEFAULT_FIELDS):
+        '''
+        Partition a long format frame (timestamp index, one row per symbol and bar) by coin and day.
+        Each partition is reindexed to the full day grid, missing bars are NaN.
+        '''
+        os.makedirs(self.root, exist_ok = True)
+        with open(os.path.join(self.root, 'meta.json'), 'w') as f:
+            json.dump({'freq': self.freq, 'fields': list(fields)}, f)
+
+        fields = {field: column for field, column in fields.items() if column in df.columns}
+        for (coin, day), part_df in df.groupby([df[symbol_column], df.index.normalize()]):
+            part_df = part_df[~part_df.index.duplicated(keep = 'last')].reindex(self._day_grid(day))
+            partition_dir = self._partition_dir(coin, day)
+            os.makedirs(partition_dir, exist_ok = True)
+            for field, column in fields.items():
+                np.save(os.path.join(partition_dir, f'{field}.npy'), part_df[column].to_numpy(dtype = float))
+
+    def coins(self) -> List[str]:
+        return sorted(name[len('coin='):] for name in os.listdir(self.root) if name.startswith('coin='))
+
+    def load(self, coins: List[str], start, end, fields: List[str] = ('bid', 'ask')) -> PriceWindow:
+        '''Prices for coins over [start, end] (inclusive) without reading any other coin or day'''
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        index_pieces, day_slices = [], []
+        for day in pd.date_range(start.normalize(), end.normalize(), freq = 'D'):
+            grid = self._day_grid(day)
+            row_slice = slice(grid.searchsorted(start, side = 'left'), grid.searchsorted(end, side = 'right'))
+            index_pieces.append(grid[row_slice])
+            day_slices.append((day, row_slice))
+
+        pieces = {}
+        for coin in coins:
+            for field in fields:
+                pieces[(coin, field)] = []
+                for day, row_slice in day_slices:
+                    path = os.path.join(self._partition_dir(coin, day), f'{field}.npy')
+                    pieces[(coin, field)].append(np.load(path, mmap_mode = 'r')[row_slice] if os.path.exists(path) else None)
+
+        index = index_pieces[0].append(index_pieces[1:]) if index_pieces else pd.DatetimeIndex([])
+        return PriceWindow(index, list(coins), pieces, day_lengths = [len(piece) for piece in index_pieces])
+
+#Per bar aggregates kept while a bar is open. The last quote's fields are taken positionally (NaN included), the
+#totals combine as below when two partial aggregates of the same bar are merged
+_LAST_COLUMNS = ['bid_0_price', 'ask_0_price', 'bid_0_size', 'ask_0_size']
+_TOTAL_AGGREGATES = {'n_ticks': 'sum', 'n_spreads': 'sum', 'spread_sum': 'sum', 'spread_max': 'max', 'size_sum': 'sum', 'size_mid_sum': 'sum'}
+STAT_FIELDS = ['n_ticks', 'spread_mean', 'spread_max', 'vwap_mid']
+
+class QuoteResampler:
+    '''
+    Raw level 1 quotes -> fixed interval bars, chunk by chunk with bounded memory.
+
+    Bars are labelled by their left edge on a grid aligned to origin (not to the first tick), closed on the left.
+    Each bar holds the last bid/ask price and size and the mid of the last quote; with stats = True also the number of
+    ticks, mean and max bid/ask spread and the quote size weighted mid (vwap_mid).
+    The last quote is taken as it is: if its bid or ask is missing the bar's value is NaN, not an older quote's
+    (repair_gaps fills such bars explicitly). Spread and vwap_mid statistics skip quotes with a missing side.
+
+    Chunks must arrive in time order. The last bar of each chunk may continue in the next one, so it is kept as a partial
+    aggregate and merged; only bars before the bar of the chunk's last tick are final. With a store, final bars are
+    buffered per day and each day is written once it is complete, so memory holds at most one day of bars plus one chunk.
+    '''
+    def __init__(self, freq: str = '10s', origin = '1970-01-01', stats: bool = False, store: MarketDataStore = None,
+                 symbol_column: str = 'symbol', time_column: str = None):
+        self.freq = pd.Timedelta(freq)
+        self.origin = pd.Timestamp(origin)
+        if store is not None and ((self.origin - self.origin.normalize()) % self.freq or pd.Timedelta(days = 1) % self.freq
+                                  or pd.Timedelta(store.freq) != self.freq):
+            raise ValueError('Bars must lie on the store grid: same freq, dividing a day, origin on a bar boundary from midnight')
+        self.stats = stats
+        self.store = store
+        self.symbol_column = symbol_column
+        self.time_column = time_column
+        self._open = None #partial aggregates of the bars still open, indexed by (symbol, bar)
+        self._day_bars = [] #final bars of days not yet written to the store
+
+    def _aggregate(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        times = pd.DatetimeIndex(chunk[self.time_column] if self.time_column is not None else chunk.index)
+        bid, ask = chunk['bid_0_price'].to_numpy(dtype = float), chunk['ask_0_price'].to_numpy(dtype = float)
+        has_sizes = 'bid_0_size' in chunk.columns and 'ask_0_size' in chunk.columns
+        bid_size = chunk['bid_0_size'].to_numpy(dtype = float) if has_sizes else np.full(len(chunk), np.nan)
+        ask_size = chunk['ask_0_size'].to_numpy(dtype = float) if has_sizes else np.full(len(chunk), np.nan)
+        spread = ask - bid
+        mid = (bid + ask) / 2
+        #Weight only quotes with both sides, so that size_mid_sum / size_sum is a weighted mean of the same quotes
+        size = np.where(np.isnan(mid), np.nan, bid_size + ask_size)
+        ticks = pd.DataFrame({
+            'bid_0_price': bid, 'ask_0_price': ask, 'bid_0_size': bid_size, 'ask_0_size': ask_size,
+            'n_ticks': 1, 'n_spreads': (~np.isnan(spread)).astype(int), 'spread_sum': spread, 'spread_max': spread,
+            'size_sum': size, 'size_mid_sum': size * mid,
+        }, index = pd.MultiIndex.from_arrays([chunk[self.symbol_column].to_numpy(), self.origin + (times - self.origin).floor(self.freq)],
+                                             names = ['symbol', 'bar']))
+        #Stable sort keeps the arrival order of ticks with equal timestamps, so the last row is the last quote
+        if not times.is_monotonic_increasing:
+            ticks = ticks.iloc[np.argsort(times.asi8, kind = 'stable')]
+        return self._combine(ticks)
+
+    @staticmethod
+    def _combine(partial: pd.DataFrame) -> pd.DataFrame:
+        '''One row per (symbol, bar) from rows in time order: last row's quote fields, totals of the rest'''
+        last = partial.loc[~partial.index.duplicated(keep = 'last'), _LAST_COLUMNS]
+        totals = partial.groupby(level = ['symbol', 'bar'], sort = False).agg(_TOTAL_AGGREGATES)
+        return totals.join(last)[_LAST_COLUMNS + list(_TOTAL_AGGREGATES)]
+
+    def _finalise(self, partial: pd.DataFrame) -> pd.DataFrame:
+        bars = partial.reset_index(level = 'symbol')
+        bars.index.name = None
+        bars['mid_price'] = (bars['bid_0_price'] + bars['ask_0_price']) / 2
+        columns = ['symbol', *DEFAULT_FIELDS.values()]
+        if self.stats:
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                bars['spread_mean'] = bars['spread_sum'] / bars['n_spreads']
+                bars['vwap_mid'] = bars['size_mid_sum'] / bars['size_sum']
+            columns += STAT_FIELDS
+        return bars[columns].sort_index(kind = 'stable')
+
+    def update(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        '''Add one chunk of raw quotes, returns the bars that became final (long format, bar timestamp index), None for an empty chunk'''
+        if not len(chunk):
+            return None
+        partial = self._aggregate(chunk)
+        if self._open is not None:
+            #Carried bars first, so that the newer quote is last
+            partial = self._combine(pd.concat([self._open, partial]))
+        last_bar = partial.index.get_level_values('bar').max()
+        is_open = partial.index.get_level_values('bar') == last_bar
+        self._open = partial[is_open]
+        bars = self._finalise(partial[~is_open])
+        self._write(bars, until = last_bar.normalize())
+        return bars
+
+    def flush(self) -> pd.DataFrame:
+        '''Close the open bars at the end of the data and write the remaining days'''
+        bars = self._finalise(self._open) if self._open is not None else None
+        self._open = None
+        self._write(bars, until = None)
+        return bars
+
+    def _write(self, bars: pd.DataFrame, until: pd.Timestamp):
+        '''Buffer final bars and write every buffered day before until (all of them if None) to the store'''
+        if self.store is None:
+            return
+        if bars is not None and len(bars):
+            self._day_bars.append(bars)
+        if not self._day_bars:
+            return
+        buffered = pd.concat(self._day_bars)
+        done = buffered.index < until if until is not None else np.ones(len(buffered), dtype = bool)
+        if done.any():
+            fields = {**DEFAULT_FIELDS, **({field: field for field in STAT_FIELDS} if self.stats else {})}
+            self.store.write(buffered[done], symbol_column = 'symbol', fields = fields)
+        self._day_bars = [buffered[~done]] if not done.all() else []
+
+    def run(self, chunks) -> Optional[pd.DataFrame]:
+        '''Resample every chunk; returns all bars when there is no store, otherwise writes them and returns None'''
+        if self.store is not None:
+            #Bars are written by day as they become final, keep none of them here
+            for chunk in chunks:
+                self.update(chunk)
+            self.flush()
+            return None
+        bars = [self.update(chunk) for chunk in chunks] + [self.flush()]
+        return pd.concat([df for df in bars if df is not None])
+
+def read_quote_chunks(path: str, batch_size: int = 1_000_000, columns: List[str] = None, time_column: str = None):
+    '''Raw quotes from a parquet file as DataFrames of at most batch_size rows, without loading the whole file'''
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size = batch_size, columns = columns):
+        chunk = batch.to_pandas()
+        yield chunk.set_index(time_column) if time_column is not None else chunk
@@ -0,0 +1,12 @@
+'''Optional numba support: kernels run as plain Python when numba is not installed'''
+try: 
+    from numba import njit 
+    NUMBA_AVAILABLE = True
+except ImportError: 
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs): 
+        '''No-op stand in for numba.njit, supports both @njit and @njit(...)'''
+        if len(args) == 1 and callable(args[0]) and not kwargs: 
+            return args[0]
+        return lambda func: func
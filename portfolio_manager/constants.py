@@ -4,4 +4,9 @@ HOURLY_INTEREST_RATE_BY_COIN = {
     'ADA-USDT': 5.4963*10e-6,
     'BTC-USDT': 4.321*10e-6
 }
-DEFAULT_HOURLY_INTEREST_RATE = 4.321*10e-6
\ No newline at end of file
+DEFAULT_HOURLY_INTEREST_RATE = 4.321*10e-6
+#Precision mode -> dtype of each kind of array. Cash, costs and equity are accumulated in float64 in every mode
+PRECISION_DTYPES = {
+    'float64': {'price': 'float64', 'signal': 'float64', 'position': 'float64', 'action': 'int64'},
+    'compact': {'price': 'float32', 'signal': 'float32', 'position': 'float32', 'action': 'int8'},
+}
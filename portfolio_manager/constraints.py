@@ -1,12 +1,13 @@
-from typing import Tuple
+from typing import Optional, Tuple
 import numpy as np 
 import pandas as pd
 
 class ConstraintChecker: 
     """Handle constraint enforcement"""
-    def __init__(self, max_position_value: float, margin_threshold: float):
+    def __init__(self, max_position_value: float, margin_threshold: float, lot_size: float = 1.0):
         self.max_position_value = max_position_value
         self.margin_threshold = margin_threshold
+        self.lot_size = lot_size
 
     def check_capital_limit(self, 
                             desired_y_units: int, 
@@ -34,6 +35,34 @@ class ConstraintChecker:
             return False, actual_y_units, actual_x_units
         else: 
             return True, desired_y_units, desired_x_units
+
+    def check_capital_limit_array(self, position: np.ndarray, price: np.ndarray, lot_size: float = None) -> Tuple[np.ndarray, np.ndarray]: 
+        '''
+        check_capital_limit for every period at once. 
+        Args: 
+            position, price: (n_periods, n_coins) desired units and prices
+            lot_size: overrides self.lot_size for this call 
+        Returns: 
+            (within_limit (n_periods,), actual units (n_periods, n_coins)). 
+            Periods over the limit are scaled down to max_position_value, then rounded to whole lots towards zero 
+            (so that rounding a short never adds exposure). 
+        '''
+        within_limit, scale = self.capital_limit_scale(position, price)
+        return within_limit, self.apply_capital_scale(position, within_limit, scale, lot_size = lot_size)
+
+    def capital_limit_scale(self, position: np.ndarray, price: np.ndarray) -> Tuple[np.ndarray, np.ndarray]: 
+        '''(within_limit, scale) per period: scale = max_position_value / gross exposure over the limit, 1 within it'''
+        total_value = np.nansum(np.abs(position * price), axis = 1)
+        within_limit = total_value <= self.max_position_value
+        with np.errstate(divide = 'ignore'): 
+            scale = np.where(within_limit, 1.0, self.max_position_value / total_value)
+        return within_limit, scale
+
+    def apply_capital_scale(self, position: np.ndarray, within_limit: np.ndarray, scale: np.ndarray, lot_size: float = None) -> np.ndarray: 
+        '''Scale (n_periods, k) units by capital_limit_scale of periods over the limit, truncated to lots towards zero'''
+        lot_size = self.lot_size if lot_size is None else lot_size
+        scaled = np.trunc(position * scale[:, None] / lot_size) * lot_size
+        return np.where(within_limit[:, None], position, scaled).astype(position.dtype, copy = False)
         
     def check_margin_call(self, equity: float, initial_capital: float) -> bool: 
         '''
@@ -42,6 +71,10 @@ class ConstraintChecker:
         liquidation_level = initial_capital * self.margin_threshold
         return equity < liquidation_level 
 
+    def first_margin_call(self, equity: np.ndarray, initial_capital: float) -> Optional[int]: 
+        '''Index of the first period breaching check_margin_call on an equity curve, None if never'''
+        return _first_true(self.check_margin_call(equity, initial_capital), len(equity))
+
 class DummyConstraintChecker:
     """Pass-through constraint checker for idealized backtesting"""
     def __init__(self, *args, **kwargs):
@@ -50,7 +83,27 @@ class DummyConstraintChecker:
     def check_capital_limit(self, positions: pd.Series):
         """Return desired positions unchanged"""
         return positions
+
+    def check_capital_limit_array(self, position: np.ndarray, price: np.ndarray, lot_size: float = None):
+        """Return desired positions unchanged"""
+        return np.ones(len(position), dtype = bool), position
+
+    def capital_limit_scale(self, position: np.ndarray, price: np.ndarray):
+        """Every period within the limit"""
+        return np.ones(len(position), dtype = bool), np.ones(len(position))
+
+    def apply_capital_scale(self, position: np.ndarray, within_limit: np.ndarray, scale: np.ndarray, lot_size: float = None):
+        """Return positions unchanged"""
+        return position
     
     def check_margin_call(self, equity, initial_capital):
         """Never trigger margin calls"""
-        return False
\ No newline at end of file
+        return False
+
+    def first_margin_call(self, equity, initial_capital):
+        """Never trigger margin calls"""
+        return None
+
+def _first_true(breaches, n_periods: int) -> Optional[int]: 
+    breaches = np.flatnonzero(np.broadcast_to(breaches, (n_periods,)))
+    return int(breaches[0]) if len(breaches) else None
@@ -1,4 +1,5 @@
 import numpy as np 
+import pandas as pd
 class MetricsCalculator:
     """Helper: Calculate performance metrics (organized by category)"""
     
@@ -9,6 +10,7 @@ class MetricsCalculator:
         """
         self.periods_per_year = periods_per_year
         self.risk_adjusted = self.RiskAdjusted(self.periods_per_year)  # Create instance
+        self.bootstrap = self.Bootstrap(self.periods_per_year)
     
     class RiskAdjusted:
         """Risk-adjusted performance metrics"""
@@ -37,26 +39,121 @@ class MetricsCalculator:
             return np.sqrt(self.periods_per_year) * returns.mean() / downside.std()
         
         def _max_drawdown(self, returns): 
-            cum_returns = 1+returns.cumsum()
-            #TODO - confusion about how we actually calculate mean returns here - should it be geometric or arithmetic? 
-            # rolling_max = cum_returns.cummax()
-            # #TODO - why calculate as percentage? 
-            # percentage_drawdown = (rolling_max - cum_returns)/cum_returns #measure decline from rolling peak 
-            # max_drawdown = percentage_drawdown.max()
-            # return max_drawdown
+            '''Largest fall of the cumulative (arithmetic) returns from a running peak, in the units of returns'''
+            return _drawdown_stats(_as_2d(returns))[0][0]
         
         def _max_drawdown_duration(self, returns): 
-            pass 
+            '''Longest number of periods spent below a previous peak of the cumulative returns'''
+            return _drawdown_stats(_as_2d(returns))[1][0]
         
         def absolute_calmar_ratio(self, net_pnl_series):
-            '''Absolute calmar ratio based on pnl series only'''
-            # returns = net_pnl_series
-            # max_drawdown = self._absolute_max_drawdown(returns)
-            # return np.sqrt(self.periods_per_year) * returns.mean() / max_drawdown
+            '''Absolute calmar ratio based on pnl series only: annualised mean pnl / max drawdown of cumulative pnl'''
+            returns = net_pnl_series
+            max_drawdown = self._max_drawdown(returns)
+            return self.periods_per_year * returns.mean() / max_drawdown if max_drawdown > 0 else np.nan
+
+        def rolling_sharpe_ratio(self, net_pnl_series, window: int, initial_capital: float = 1.0): 
+            '''sharpe_ratio over a trailing window of periods, for every period (absolute when initial_capital = 1)'''
+            returns = net_pnl_series / initial_capital
+            rolling = returns.rolling(window)
+            return np.sqrt(self.periods_per_year) * rolling.mean() / rolling.std()
+
+        def rolling_sortino_ratio(self, net_pnl_series, window: int, initial_capital: float = 1.0): 
+            '''sortino_ratio over a trailing window of periods: std of the negative returns within each window'''
+            returns = net_pnl_series / initial_capital
+            downside = returns.where(returns < 0)
+            return np.sqrt(self.periods_per_year) * returns.rolling(window).mean() / downside.rolling(window, min_periods = 2).std()
 
         def get_all(self, net_pnl_series, initial_capital):
             return {
                 'absolute_sharpe': self.absolute_sharpe_ratio(net_pnl_series),
                 'sharpe': self.sharpe_ratio(net_pnl_series, initial_capital),
                 'absolute_sortino': self.absolute_sortino_ratio(net_pnl_series),
-            }
\ No newline at end of file
+                'absolute_calmar': self.absolute_calmar_ratio(net_pnl_series),
+                'max_drawdown': self._max_drawdown(net_pnl_series),
+                'max_drawdown_duration': self._max_drawdown_duration(net_pnl_series),
+            }
+
+    class Bootstrap:
+        """
+        Circular block bootstrap of the metrics, evaluated for all resamples at once. 
+
+        Resample indices are drawn as (n_resamples, n_periods) matrices (as arch CircularBlockBootstrap: blocks of 
+        block_size consecutive periods from uniform random starts, wrapping around the end), and every metric is computed 
+        along axis 1 of the resampled pnl matrix. 
+        """
+        def __init__(self, periods_per_year):
+            self.periods_per_year = periods_per_year
+
+        @staticmethod
+        def block_indices(n_periods: int, block_size: int, n_resamples: int, seed = None) -> np.ndarray: 
+            '''seed: anything np.random.default_rng takes, a Generator is used as is (draws continue its stream)'''
+            rng = np.random.default_rng(seed)
+            n_blocks = -(-n_periods // block_size)
+            starts = rng.integers(0, n_periods, size = (n_resamples, n_blocks))
+            indices = (starts[:, :, None] + np.arange(block_size)) % n_periods
+            return indices.reshape(n_resamples, -1)[:, :n_periods]
+
+        def metrics(self, pnl: np.ndarray, initial_capital: float) -> dict: 
+            '''RiskAdjusted.get_all for every row of pnl (n_samples, n_periods), NaN periods are ignored'''
+            scale = np.sqrt(self.periods_per_year)
+            with np.errstate(invalid = 'ignore', divide = 'ignore'): 
+                mean = np.nanmean(pnl, axis = 1)
+                std = np.nanstd(pnl, axis = 1, ddof = 1)
+                downside = np.where(pnl < 0, pnl, np.nan)
+                max_drawdown, max_drawdown_duration = _drawdown_stats(pnl)
+                return {
+                    'absolute_sharpe': scale * mean / std, 
+                    #Initial capital cancels out as in sharpe_ratio, up to rounding 
+                    'sharpe': scale * (mean / initial_capital) / (std / initial_capital), 
+                    'absolute_sortino': scale * np.nanmean(downside, axis = 1) / np.nanstd(downside, axis = 1, ddof = 1), 
+                    'absolute_calmar': np.where(max_drawdown > 0, self.periods_per_year * mean / max_drawdown, np.nan), 
+                    'max_drawdown': max_drawdown, 
+                    'max_drawdown_duration': max_drawdown_duration, 
+                }
+
+        def confidence_intervals(self, net_pnl_series, initial_capital: float, n_resamples: int = 1000, block_size: int = 50, 
+                                 confidence: float = 0.95, seed = None, batch_size: int = 1000): 
+            '''
+            Observed metrics with bootstrap percentile intervals, one row per metric 
+            (observed, ci_lower, ci_upper, bootstrap_mean, bootstrap_std as the notebook's bootstrap_confidence_interval). 
+            Resamples are drawn and evaluated batch_size at a time, so memory is bounded by a few batch_size x n_periods 
+            arrays whatever n_resamples. 
+            '''
+            pnl = np.asarray(net_pnl_series, dtype = float)
+            rng = np.random.default_rng(seed)
+            batches = [
+                self.metrics(pnl[self.block_indices(len(pnl), block_size, min(batch_size, n_resamples - i), seed = rng)], initial_capital) 
+                for i in range(0, n_resamples, batch_size)
+            ]
+            samples = {metric: np.concatenate([batch[metric] for batch in batches]) for metric in batches[0]}
+            observed = self.metrics(pnl[None], initial_capital)
+            alpha = 1 - confidence
+            return pd.DataFrame({
+                metric: {
+                    'observed': observed[metric][0], 
+                    'ci_lower': np.nanpercentile(values, 100 * alpha / 2), 
+                    'ci_upper': np.nanpercentile(values, 100 * (1 - alpha / 2)), 
+                    'bootstrap_mean': np.nanmean(values), 
+                    'bootstrap_std': np.nanstd(values), 
+                } for metric, values in samples.items()
+            }).T
+
+def _as_2d(returns) -> np.ndarray: 
+    return np.asarray(returns, dtype = float).reshape(1, -1)
+
+def _drawdown_stats(returns: np.ndarray): 
+    '''
+    Max drawdown and max drawdown duration (periods) of the cumulative returns of every row, in one pass. 
+    The running peak starts at 0 (the initial capital), NaN returns count as 0. 
+    '''
+    n_rows, n_periods = returns.shape
+    cum = np.zeros((n_rows, n_periods + 1))
+    np.cumsum(np.nan_to_num(returns), axis = 1, out = cum[:, 1:])
+    peak = np.maximum.accumulate(cum, axis = 1)
+    max_drawdown = (peak - cum).max(axis = 1)
+    #Periods since the last period at a peak 
+    periods = np.arange(n_periods + 1)
+    last_peak = np.maximum.accumulate(np.where(cum >= peak, periods, 0), axis = 1)
+    max_drawdown_duration = (periods - last_peak).max(axis = 1)
+    return max_drawdown, max_drawdown_duration
@@ -3,7 +3,12 @@ import pandas as pd
 import numpy as np 
 
 class PnLCalculator:
-    """Handles P&L calculations and tracking"""
+    """
+    Handles P&L calculations and tracking. 
+
+    Reference implementation: the backtest engines use ArrayPnLCalculator, this pandas version is kept as the plain 
+    statement of the ledger that it is checked against (code_testing.ipynb). 
+    """
     def __init__(self, initial_capital: float, index: pd.Index = None): 
         self.initial_capital = initial_capital
         self.index = index
@@ -35,10 +40,108 @@ class PnLCalculator:
         #We need to update costs at every step to keep track of margins
         self.state_df.loc[t, 'cost'] = self.state_df.loc[t, ['cost_spot', 'cost_interest']].sum()
 
+    def update_all(self, cash_flow: np.ndarray, position_value: np.ndarray, cost_spot: np.ndarray, cost_interest: np.ndarray): 
+        '''Vectorised update: write whole-period arrays (one value per timestamp) in one go'''
+        self.state_df['cash_flow'] = cash_flow
+        self.state_df['position_value'] = position_value
+        self.state_df['cost_spot'] = cost_spot
+        self.state_df['cost_interest'] = cost_interest
+        self.state_df['cost'] = cost_spot + cost_interest
+
     def summarise(self):
         #Update 
         self.cum_df['running_cost'] = self.state_df['cost'].cumsum()
         self.cum_df['running_cash_gross'] =  self.state_df['cash_flow'].cumsum()
         self.cum_df['running_cash'] = self.cum_df['running_cash_gross'] - self.cum_df['running_cost']
         self.cum_df['equity_curve'] = self.initial_capital + self.cum_df['running_cash'] + self.state_df['position_value']   
-        self.summary_df = pd.concat([self.state_df, self.cum_df], axis = 1)
\ No newline at end of file
+        self.summary_df = pd.concat([self.state_df, self.cum_df], axis = 1)
+
+class ArrayPnLCalculator:
+    """
+    P&L ledger backed by preallocated NumPy arrays (one contiguous column per field and an integer row cursor). 
+    Same summary_df as PnLCalculator, but nothing is materialised as pandas until summarise(). 
+    
+    by_coin = True also keeps a per-coin breakdown, recorded from (n_coins,) arrays without building pd.Series per step, 
+    stored as dtype (e.g. float32 in compact precision). Per-period totals and running sums are always float64. 
+    """
+    STATE_FIELDS = ['cash_flow', 'position_value', 'cost_spot', 'cost_interest', 'cost']
+    COIN_FIELDS = ['cash_flow', 'position_value', 'cost_spot', 'cost_interest']
+    __slots__ = ('initial_capital', 'index', 'coins', 'by_coin', '_state', '_state_by_coin', '_cursor', 'state_df', 'cum_df', 'summary_df')
+
+    def __init__(self, initial_capital: float, index: pd.Index = None, coins: list = None, by_coin: bool = False, dtype = np.float64): 
+        self.initial_capital = initial_capital
+        self.index = index
+        self.coins = coins
+        self.by_coin = by_coin
+        n_periods = len(index)
+        self._state = {field: np.zeros(n_periods) for field in self.STATE_FIELDS}
+        self._state_by_coin = {field: np.zeros((n_periods, len(coins)), dtype = dtype) for field in self.COIN_FIELDS} if by_coin else None
+        self._cursor = 0
+        self.state_df = self.cum_df = self.summary_df = None
+
+    def record(self, cash_flow, position_value, cost_spot, cost_interest): 
+        '''Write the next period: per-coin (n_coins,) arrays, NaN coins are skipped as in pd.Series.sum'''
+        row = self._cursor
+        values = {'cash_flow': cash_flow, 'position_value': position_value, 'cost_spot': cost_spot, 'cost_interest': cost_interest}
+        for field, value in values.items(): 
+            value = np.asarray(value, dtype = float)
+            self._state[field][row] = np.nansum(value)
+            if self.by_coin: 
+                self._state_by_coin[field][row] = value
+        self._state['cost'][row] = self._state['cost_spot'][row] + self._state['cost_interest'][row]
+        self._cursor += 1
+
+    def update(self, t: pd.Timestamp, cash_flow_by_coin: pd.Series, position_value_by_coin: pd.Series, cost_by_type_coin: Dict[str, pd.Series]): 
+        '''Drop-in for PnLCalculator.update, periods must arrive in index order'''
+        if self.by_coin: 
+            #align the per-coin Series on coins, coins without a cost this period are 0
+            cost_spot = cost_by_type_coin['spot'].reindex(self.coins, fill_value = 0.0)
+            cost_interest = cost_by_type_coin['interest'].reindex(self.coins, fill_value = 0.0)
+            self.record(cash_flow_by_coin.reindex(self.coins).to_numpy(), position_value_by_coin.reindex(self.coins).to_numpy(), 
+                        cost_spot.to_numpy(), cost_interest.to_numpy())
+        else: 
+            self.record(cash_flow_by_coin.to_numpy(), position_value_by_coin.to_numpy(), 
+                        cost_by_type_coin['spot'].to_numpy(), cost_by_type_coin['interest'].to_numpy())
+
+    def update_all(self, cash_flow: np.ndarray, position_value: np.ndarray, cost_spot: np.ndarray, cost_interest: np.ndarray): 
+        '''Vectorised update: (n_periods, n_coins) arrays for the whole run'''
+        values = {'cash_flow': cash_flow, 'position_value': position_value, 'cost_spot': cost_spot, 'cost_interest': cost_interest}
+        for field, value in values.items(): 
+            #Sum coins in float64 whatever the input dtype 
+            self._state[field][:] = np.nansum(value, axis = 1, dtype = np.float64)
+            if self.by_coin: 
+                self._state_by_coin[field][:] = value
+        self._state['cost'][:] = self._state['cost_spot'] + self._state['cost_interest']
+        self._cursor = len(self.index)
+
+    def update_interest(self, cost_interest: np.ndarray): 
+        '''Set the interest of the whole run at once from (n_periods, n_coins) charges, e.g. CostCalculator.calc_interest_array'''
+        self._state['cost_interest'][:] = np.nansum(cost_interest, axis = 1, dtype = np.float64)
+        if self.by_coin: 
+            self._state_by_coin['cost_interest'][:] = cost_interest
+        self._state['cost'][:] = self._state['cost_spot'] + self._state['cost_interest']
+
+    def summarise(self, running_cash_gross: float = 0.0, running_cost: float = 0.0): 
+        '''running_cash_gross/running_cost: totals carried from a previous chunk of the same run (backtest_stream)'''
+        state = self._state
+        #Prepending the carry keeps the running sums bit-identical to a single cumsum over the whole run 
+        running_cost = np.cumsum(np.concatenate([[running_cost], state['cost']]))[1:]
+        running_cash_gross = np.cumsum(np.concatenate([[running_cash_gross], state['cash_flow']]))[1:]
+        running_cash = running_cash_gross - running_cost
+        self.state_df = pd.DataFrame(state, index = self.index, columns = self.STATE_FIELDS)
+        #Same column order as PnLCalculator.cum_df 
+        self.cum_df = pd.DataFrame({
+            'running_cash': running_cash, 
+            'equity_curve': self.initial_capital + running_cash + state['position_value'], 
+            'running_cost': running_cost, 
+            'running_cash_gross': running_cash_gross, 
+        }, index = self.index)
+        self.summary_df = pd.concat([self.state_df, self.cum_df], axis = 1)
+
+    def summary_by_coin(self) -> pd.DataFrame: 
+        '''Per-coin breakdown with (field, coin) columns, by_coin mode only'''
+        if not self.by_coin: 
+            raise ValueError('Per-coin breakdown requires by_coin = True')
+        return pd.concat({
+            field: pd.DataFrame(values, index = self.index, columns = self.coins) for field, values in self._state_by_coin.items()
+        }, axis = 1)
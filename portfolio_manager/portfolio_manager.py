@@ -1,11 +1,14 @@
-from typing import Dict, Tuple
+import os
+from typing import Dict, Iterable, Tuple
 import numpy as np 
 import pandas as pd
 from tqdm import tqdm 
 
+from .constants import PRECISION_DTYPES
 from .constraints import ConstraintChecker, DummyConstraintChecker 
 from .metrics import MetricsCalculator
-from .pnl import PnLCalculator
+from .pnl import ArrayPnLCalculator
+from .profiling import StageProfiler
 from .transaction_costs import CostCalculator 
 
 #TODO - fix up implementation of portfolio manager backtest 
@@ -31,8 +34,15 @@ class PortfolioManager:
                  transaction_cost: float = 0.0,
                  hourly_interest_rate_by_coin: dict = {},
                  margin_threshold: float = 0.5, 
+                 pnl_by_coin: bool = False, 
+                 interest_method: str = 'upper_bound', 
+                 profiler: StageProfiler = None, 
+                 precision: str = 'float64', 
+                 lot_size: float = 1.0, 
                  ):
         
+        if precision not in PRECISION_DTYPES: 
+            raise ValueError(f"precision must be one of {list(PRECISION_DTYPES)}, got {precision}")
         self.initial_capital = initial_capital
         
         # Create helper objects
@@ -40,11 +50,19 @@ class PortfolioManager:
             self.constraints = DummyConstraintChecker()
         
         else: 
-            self.constraints = ConstraintChecker(max_position_value=initial_capital * max_leverage, margin_threshold=margin_threshold)
+            #Capped positions are truncated to multiples of lot_size: use the exchange's step size for fractional coins 
+            self.constraints = ConstraintChecker(max_position_value=initial_capital * max_leverage, margin_threshold=margin_threshold, lot_size=lot_size)
         
-        self.costs =  CostCalculator(transaction_cost_rate=transaction_cost, hourly_interest_rate_by_coin = hourly_interest_rate_by_coin)
+        self.costs =  CostCalculator(transaction_cost_rate=transaction_cost, hourly_interest_rate_by_coin = hourly_interest_rate_by_coin, interest_method = interest_method)
         self.metrics_calc = MetricsCalculator(periods_per_year = trading_periods_per_year)   
         self.is_liquidated = False
+        #Keep a per-coin PnL breakdown (results['pnl_by_coin'])
+        self.pnl_by_coin = pnl_by_coin
+        #Opt-in stage timings, e.g. PortfolioManager(..., profiler = StageProfiler(enabled = True)) then .profiler.report() 
+        self.profiler = profiler if profiler is not None else StageProfiler()
+        #Array engines hold prices and positions in these dtypes ('compact': float32), the loop backtest stays float64 
+        self.precision = precision
+        self.dtypes = PRECISION_DTYPES[precision]
 
     def _calc_cash_flow_by_coin(self, position_change_by_coin: Dict[str, float], current_price: pd.Series) -> pd.Series: 
         '''Rebalance position of one asset using current bid/ask prices.'''
@@ -61,18 +79,89 @@ class PortfolioManager:
             coin: position*price[coin]['ask' if position < 0 else 'bid'] for (coin, position) in position.items() }
         return pd.Series(m2m_by_coin)
     
-    def _calc_results(self, pnl_calculator: PnLCalculator, position_df: pd.DataFrame) -> Dict: 
+    def _calc_cash_flow_array(self, position_change: np.ndarray, bid: np.ndarray, ask: np.ndarray) -> np.ndarray: 
+        '''Array version of _calc_cash_flow_by_coin: buy at the ask, sell at the bid'''
+        return -position_change * np.where(position_change > 0, ask, bid)
+
+    def _calc_m2m_array(self, position: np.ndarray, bid: np.ndarray, ask: np.ndarray) -> np.ndarray: 
+        '''Array version of _calc_m2m_by_coin: close shorts at the ask, longs at the bid'''
+        return position * np.where(position < 0, ask, bid)
+
+    def _run_arrays(self, index: pd.DatetimeIndex, coins: list, position: np.ndarray, bid: np.ndarray, ask: np.ndarray, 
+                    state: Dict = None) -> ArrayPnLCalculator: 
+        '''
+        Run the whole backtest on (n_periods, n_coins) arrays of executed positions and bid/ask prices. 
+        state: boundary state of the previous chunk when the run is split into chunks (backtest_stream), see _next_state 
+        '''
+        with self.profiler.stage('interest'): 
+            if state is None: 
+                position_change = np.diff(position, axis = 0, prepend = position[:1])
+                interest_by_coin = self.costs.calc_interest_array(index, position, bid, ask, coins)
+                running_cash_gross = running_cost = 0.0
+            else: 
+                position_change = np.diff(position, axis = 0, prepend = state['position'][None])
+                #Interest windows reach back into the previous chunk 
+                tail_index, tail_position, tail_bid, tail_ask = state['tail']
+                interest_by_coin = self.costs.calc_interest_array(
+                    tail_index.append(index), np.vstack([tail_position, position]), np.vstack([tail_bid, bid]), np.vstack([tail_ask, ask]), coins
+                )[len(tail_index):]
+                running_cash_gross, running_cost = state['running_cash_gross'], state['running_cost']
+        with self.profiler.stage('cash_flow'): 
+            cash_flow_by_coin = self._calc_cash_flow_array(position_change, bid, ask)
+        with self.profiler.stage('costs'): 
+            spot_by_coin = self.costs.calc_spot_fees_array(position_change, bid, ask)
+        with self.profiler.stage('m2m'): 
+            m2m_by_coin = self._calc_m2m_array(position, bid, ask)
+
+        with self.profiler.stage('pnl_update'): 
+            pnl_calculator = ArrayPnLCalculator(self.initial_capital, index, coins, by_coin = self.pnl_by_coin, dtype = self.dtypes['price'])
+            pnl_calculator.update_all(
+                cash_flow = cash_flow_by_coin, 
+                position_value = m2m_by_coin, 
+                cost_spot = spot_by_coin, 
+                cost_interest = interest_by_coin, 
+            )
+        with self.profiler.stage('summarise'): 
+            pnl_calculator.summarise(running_cash_gross = running_cash_gross, running_cost = running_cost)
+        return pnl_calculator
+
+    @staticmethod
+    def _next_state(state: Dict, index: pd.DatetimeIndex, close_position: np.ndarray, position: np.ndarray, bid: np.ndarray, ask: np.ndarray, 
+                    pnl_calculator: ArrayPnLCalculator) -> Dict: 
+        '''Boundary state carried to the next chunk: last positions, running totals and the last hour of arrays for interest'''
+        tail_index, tail_position, tail_bid, tail_ask = state['tail']
+        tail_index = tail_index.append(index)
+        #Charges after this chunk only look back to rows later than (last period - 1 hour) 
+        keep = tail_index.searchsorted(index[-1] - pd.Timedelta(hours=1), side = 'right')
+        cum_df = pnl_calculator.cum_df
+        return {
+            'close_position': close_position[-1], 
+            'position': position[-1], 
+            'running_cash_gross': cum_df['running_cash_gross'].iloc[-1], 
+            'running_cost': cum_df['running_cost'].iloc[-1], 
+            'tail': (tail_index[keep:], np.vstack([tail_position, position])[keep:], np.vstack([tail_bid, bid])[keep:], np.vstack([tail_ask, ask])[keep:]), 
+            'liquidated': state['liquidated'], 
+        }
+
+    @staticmethod
+    def _calc_summary_df(pnl_calculator: ArrayPnLCalculator, position_df: pd.DataFrame) -> pd.DataFrame: 
+        return pd.concat([
+            position_df,
+            pnl_calculator.summary_df,
+        ], axis=1, keys = ['Position', 'PnL']
+        )
+
+    def _calc_results(self, pnl_calculator: ArrayPnLCalculator, position_df: pd.DataFrame) -> Dict: 
         pnl = pnl_calculator.cum_df['equity_curve'].diff()
         risk_adjusted = self.metrics_calc.risk_adjusted.get_all(pnl, self.initial_capital)
         
-        return {
-            'summary_df': pd.concat([
-                position_df,
-                pnl_calculator.summary_df,
-            ], axis=1, keys = ['Position', 'PnL']
-            ),  
+        results = {
+            'summary_df': self._calc_summary_df(pnl_calculator, position_df),  
             **risk_adjusted
         }
+        if self.pnl_by_coin: 
+            results['pnl_by_coin'] = pnl_calculator.summary_by_coin()
+        return results
 
     def backtest(self, 
                     close_position_df: pd.DataFrame, 
@@ -91,41 +180,301 @@ class PortfolioManager:
         #Initialise 
         coins = close_position_df.columns.get_level_values(0).unique().to_list()
         position_df = pd.DataFrame({col: pd.Series(0.0, index = close_position_df.index) for col in coins})
-        pnl_calculator = PnLCalculator(self.initial_capital, close_position_df.index)
+        pnl_calculator = ArrayPnLCalculator(self.initial_capital, close_position_df.index, coins, by_coin = self.pnl_by_coin)
 
         if not instant_execution: 
             #1 period lag: at end of period t-1 we have desired position that we can only execute based on period t prices 
             close_position_df = close_position_df.shift(1, fill_value = 0.0)
         
+        profiler = self.profiler
         # If our portfolio has been liquidated, we can no longer trade 
         for idx, t in enumerate(tqdm(close_position_df.index)):
             if self.is_liquidated: 
                 break
 
             ##Rebalance portfolio 
-            current_price_df, current_position_df = prices_df.loc[t], close_position_df.loc[t]
-            current_position_df = self.constraints.check_capital_limit(current_position_df)
-            position_df.loc[t] = current_position_df
+            with profiler.stage('constraints'): 
+                current_price_df, current_position_df = prices_df.loc[t], close_position_df.loc[t]
+                mid_price = (current_price_df.xs('bid', level = 1) + current_price_df.xs('ask', level = 1)) / 2
+                _, capped = self.constraints.check_capital_limit_array(current_position_df[coins].to_numpy(dtype = float)[None], mid_price[coins].to_numpy(dtype = float)[None])
+                current_position_df = pd.Series(capped[0], index = coins)
+                position_df.loc[t] = current_position_df
             
             ##Cash flows 
-            position_change_by_coin = (position_df.iloc[idx] - position_df.iloc[idx-1]) if idx > 0 else pd.Series(0.0, index = coins)
-            cash_flow_by_coin = self._calc_cash_flow_by_coin(position_change_by_coin, current_price_df)
-
-            # Costs 
-            if (t.minute ==0 & t.second ==0):
-                start_hour = t - pd.Timedelta(hours=1)
-                #Calculat interest fees that occured in the previous hour 
-                recent_position_df = position_df.loc[start_hour:t].iloc[:-1]
-                recent_prices_df = prices_df.loc[start_hour:t].iloc[:-1]
-                transaction_costs_by_type_coin = self.costs.calc_total_cost(position_change_by_coin, current_price_df, recent_position_df, recent_prices_df)
-            else: 
-                  transaction_costs_by_type_coin = self.costs.calc_total_cost(position_change_by_coin, current_price_df)
+            with profiler.stage('cash_flow'): 
+                position_change_by_coin = (position_df.iloc[idx] - position_df.iloc[idx-1]) if idx > 0 else pd.Series(0.0, index = coins)
+                cash_flow_by_coin = self._calc_cash_flow_by_coin(position_change_by_coin, current_price_df)
+
+            # Spot costs, interest is charged for the whole run after the loop 
+            with profiler.stage('costs'): 
+                transaction_costs_by_type_coin = self.costs.calc_total_cost(position_change_by_coin, current_price_df)
             #m2m
-            m2m_by_coin= self._calc_m2m_by_coin(current_position_df, current_price_df)
+            with profiler.stage('m2m'): 
+                m2m_by_coin= self._calc_m2m_by_coin(current_position_df, current_price_df)
 
             #4. Update PnL 
-            pnl_calculator.update(t, cash_flow_by_coin, m2m_by_coin, transaction_costs_by_type_coin)
+            with profiler.stage('pnl_update'): 
+                pnl_calculator.update(t, cash_flow_by_coin, m2m_by_coin, transaction_costs_by_type_coin)
         
-        pnl_calculator.summarise()
+        #Interest for every hour in one pass over the executed positions 
+        with profiler.stage('interest'): 
+            pnl_calculator.update_interest(self.costs.calc_interest_df(position_df, prices_df).to_numpy())
+        with profiler.stage('summarise'): 
+            pnl_calculator.summarise()
+
+        return self._calc_results(pnl_calculator, position_df)
+
+    def backtest_vectorised(self, 
+                            close_position_df: pd.DataFrame, 
+                            prices_df: pd.DataFrame, 
+                            instant_execution: bool = False
+                            ) -> Dict: 
+        '''
+        Array-native version of backtest: same inputs, same summary_df and metrics. 
+
+        Position deltas, cash flows, spot fees, interest and mark to market are computed as whole-array operations 
+        over (n_periods, n_coins) arrays. The only path-dependent step is a margin call: positions are liquidated 
+        from the period after the first breach and the arrays are recomputed once. 
+        '''
+        #Initialise 
+        coins = close_position_df.columns.get_level_values(0).unique().to_list()
+        index = close_position_df.index
+        prices_df = prices_df.loc[index]
+
+        return self.backtest_arrays(
+            index = index, 
+            coins = coins, 
+            close_position = close_position_df[coins].to_numpy(dtype = self.dtypes['position']), 
+            bid = prices_df.xs('bid', axis = 1, level = 1)[coins].to_numpy(dtype = self.dtypes['price']), 
+            ask = prices_df.xs('ask', axis = 1, level = 1)[coins].to_numpy(dtype = self.dtypes['price']), 
+            instant_execution = instant_execution
+        )
+
+    def backtest_arrays(self, 
+                        index: pd.DatetimeIndex, 
+                        coins: list, 
+                        close_position: np.ndarray, 
+                        bid: np.ndarray, 
+                        ask: np.ndarray, 
+                        instant_execution: bool = False
+                        ) -> Dict: 
+        '''
+        backtest_vectorised on raw (n_periods, n_coins) arrays, columns ordered as coins. 
+        Lets callers holding arrays (e.g. in shared memory) skip building the MultiIndex prices frame. 
+        '''
+        if instant_execution: 
+            position = np.array(close_position, dtype = self.dtypes['position'])
+        else: 
+            #1 period lag: at end of period t-1 we have desired position that we can only execute based on period t prices 
+            position = np.zeros(close_position.shape, dtype = self.dtypes['position'])
+            position[1:] = close_position[:-1]
+
+        #Gross exposure cap on every period at once, valued at mid prices 
+        with self.profiler.stage('constraints'): 
+            _, position = self.constraints.check_capital_limit_array(position, (bid + ask) / 2)
+        pnl_calculator = self._run_arrays(index, coins, position, bid, ask)
+
+        #Margin call - liquidate everything from the period after the first breach 
+        with self.profiler.stage('margin_call'): 
+            breach = self.constraints.first_margin_call(pnl_calculator.cum_df['equity_curve'].to_numpy(), self.initial_capital)
+        if breach is not None: 
+            self.is_liquidated = True
+            position = position.copy()
+            position[breach + 1:] = 0.0
+            pnl_calculator = self._run_arrays(index, coins, position, bid, ask)
+
+        position_df = pd.DataFrame(position, index = index, columns = coins)
+        return self._calc_results(pnl_calculator, position_df)
+
+    def backtest_pairs(self, 
+                       pair_positions: Dict[str, pd.DataFrame], 
+                       prices_df: pd.DataFrame, 
+                       instant_execution: bool = False, 
+                       lot_size: float = None
+                       ) -> Dict: 
+        '''
+        Backtest a book of pairs sharing one capital pool. 
+
+        Desired positions of all pairs are netted per coin before cash flows and fees (a coin held by several pairs is 
+        traded once), the capital limit and margin call apply to the combined book, and PnL is attributed back to pairs. 
+        Each pair is kept as its own (n_periods, 2) array, so runtime is linear in pairs x periods. 
+
+        - Args: 
+            - pair_positions: pair name -> close_position_df (coin columns) as passed to backtest, all on the same index 
+            - lot_size: overrides the manager's lot_size for the capital limit 
+        - Returns: 
+            - backtest results of the combined book, plus 
+                - 'pnl_by_pair': (pair, field) columns, fields as the PnL summary with 'pnl' = cumulative net PnL of the pair 
+                - 'position_by_pair': executed positions after the book's capital limit 
+        '''
+        pairs = list(pair_positions)
+        index = pair_positions[pairs[0]].index
+        pair_coins = {pair: df.columns.get_level_values(0).unique().to_list() for pair, df in pair_positions.items()}
+        coins = list(dict.fromkeys(coin for pair in pairs for coin in pair_coins[pair]))
+        coin_idx = {coin: j for j, coin in enumerate(coins)}
+        pair_cols = {pair: np.array([coin_idx[coin] for coin in pair_coins[pair]]) for pair in pairs}
+
+        prices_df = prices_df.loc[index]
+        bid = prices_df.xs('bid', axis = 1, level = 1)[coins].to_numpy(dtype = self.dtypes['price'])
+        ask = prices_df.xs('ask', axis = 1, level = 1)[coins].to_numpy(dtype = self.dtypes['price'])
+
+        position_by_pair = {}
+        for pair, df in pair_positions.items(): 
+            close_position = df.reindex(index)[pair_coins[pair]].to_numpy(dtype = self.dtypes['position'])
+            if instant_execution: 
+                position_by_pair[pair] = close_position
+            else: 
+                position_by_pair[pair] = np.zeros(close_position.shape, dtype = close_position.dtype)
+                position_by_pair[pair][1:] = close_position[:-1]
+        position = self._net_pairs(position_by_pair, pair_cols, len(index), len(coins))
+
+        #Capital limit on the combined book: every leg of every pair is scaled by the period's factor, so pairs stay hedged 
+        #(including legs on a coin the book nets to zero), then truncated to lots and netted again into the book. 
+        #Truncating legs rather than the netted coin can leave the book up to a few lots per pair over the limit 
+        within_limit, scale = self.constraints.capital_limit_scale(position, (bid + ask) / 2)
+        position_by_pair = {pair: self.constraints.apply_capital_scale(pair_position, within_limit, scale, lot_size = lot_size) 
+                            for pair, pair_position in position_by_pair.items()}
+        position = self._net_pairs(position_by_pair, pair_cols, len(index), len(coins))
+        pnl_calculator = self._run_arrays(index, coins, position, bid, ask)
+
+        #Margin call on the book - liquidate every pair from the period after the first breach 
+        breach = self.constraints.first_margin_call(pnl_calculator.cum_df['equity_curve'].to_numpy(), self.initial_capital)
+        if breach is not None: 
+            self.is_liquidated = True
+            position = position.copy()
+            position[breach + 1:] = 0.0
+            for pair_position in position_by_pair.values(): 
+                pair_position[breach + 1:] = 0.0
+            pnl_calculator = self._run_arrays(index, coins, position, bid, ask)
+
+        results = self._calc_results(pnl_calculator, pd.DataFrame(position, index = index, columns = coins))
+        results['pnl_by_pair'] = self._attribute_pairs(index, coins, position, position_by_pair, pair_cols, bid, ask)
+        results['position_by_pair'] = pd.concat({
+            pair: pd.DataFrame(pair_position, index = index, columns = pair_coins[pair]) for pair, pair_position in position_by_pair.items()
+        }, axis = 1)
+        return results
+
+    @staticmethod
+    def _net_pairs(values_by_pair: Dict[str, np.ndarray], pair_cols: Dict[str, np.ndarray], n_periods: int, n_coins: int) -> np.ndarray: 
+        '''Sum per-pair (n_periods, 2) arrays into (n_periods, n_coins) book arrays'''
+        net = np.zeros((n_periods, n_coins), dtype = np.result_type(*values_by_pair.values()))
+        for pair, values in values_by_pair.items(): 
+            net[:, pair_cols[pair]] += values
+        return net
+
+    def _attribute_pairs(self, index: pd.DatetimeIndex, coins: list, position: np.ndarray, position_by_pair: Dict[str, np.ndarray], 
+                         pair_cols: Dict[str, np.ndarray], bid: np.ndarray, ask: np.ndarray) -> pd.DataFrame: 
+        '''
+        Split the book's PnL between pairs, exactly: summing any field over pairs gives the book. 
+            - cash flow and position value: the pair's own units at the book's execution/mark price 
+            - spot fees: the book's (netted) fee, shared by each pair's traded units 
+            - interest: the book's charge, shared by each pair's standalone interest over the same hour 
+        '''
+        n_periods, n_coins = position.shape
+        position_change = np.diff(position, axis = 0, prepend = position[:1])
+        execution_price = np.where(position_change > 0, ask, bid)
+        mark_price = np.where(position < 0, ask, bid)
+        spot = self.costs.calc_spot_fees_array(position_change, bid, ask)
+        interest = np.nan_to_num(self.costs.calc_interest_array(index, position, bid, ask, coins))
+
+        change_by_pair = {pair: np.diff(pair_position, axis = 0, prepend = pair_position[:1]) for pair, pair_position in position_by_pair.items()}
+        interest_by_pair = {pair: np.nan_to_num(self.costs.calc_interest_array(index, pair_position, bid[:, pair_cols[pair]], ask[:, pair_cols[pair]], 
+                                                                               [coins[j] for j in pair_cols[pair]])) 
+                            for pair, pair_position in position_by_pair.items()}
+        traded = self._net_pairs({pair: np.abs(change) for pair, change in change_by_pair.items()}, pair_cols, n_periods, n_coins)
+        interest_weight = self._net_pairs(interest_by_pair, pair_cols, n_periods, n_coins)
+
+        pnl_by_pair = {}
+        for pair, pair_position in position_by_pair.items(): 
+            cols = pair_cols[pair]
+            with np.errstate(divide = 'ignore', invalid = 'ignore'): 
+                spot_share = np.where(traded[:, cols] > 0, np.abs(change_by_pair[pair]) / traded[:, cols], 0.0)
+                interest_share = np.where(interest_weight[:, cols] > 0, interest_by_pair[pair] / interest_weight[:, cols], 0.0)
+            state_df = pd.DataFrame({
+                'cash_flow': np.nansum(-change_by_pair[pair] * execution_price[:, cols], axis = 1), 
+                'position_value': np.nansum(pair_position * mark_price[:, cols], axis = 1), 
+                'cost_spot': np.nansum(spot_share * spot[:, cols], axis = 1), 
+                'cost_interest': np.nansum(interest_share * interest[:, cols], axis = 1), 
+            }, index = index)
+            state_df['cost'] = state_df['cost_spot'] + state_df['cost_interest']
+            state_df['pnl'] = (state_df['cash_flow'] - state_df['cost']).cumsum() + state_df['position_value']
+            pnl_by_pair[pair] = state_df
+        return pd.concat(pnl_by_pair, axis = 1)
+
+    def backtest_stream(self, 
+                        chunks: Iterable[Tuple[pd.DataFrame, pd.DataFrame]], 
+                        output_dir: str = None, 
+                        instant_execution: bool = False, 
+                        lot_size: float = None
+                        ) -> Dict: 
+        '''
+        backtest_arrays over consecutive time chunks, for runs that do not fit in memory. 
+
+        Only the boundary state is carried between chunks (last desired and executed positions, running cash and cost, 
+        the last hour of positions/prices for interest, liquidation), so running totals, costs and the equity curve are 
+        bit-identical to the in-memory run. Each chunk's summary_df is written to output_dir as it is produced 
+        (read back with read_stream_results); only the equity curve is kept in memory for the metrics. 
+
+        - Args: 
+            - chunks: iterable of (close_position_df, prices_df) as passed to backtest, in time order 
+            - lot_size: overrides the manager's lot_size for the capital limit 
+        - Returns: 
+            - metrics of the whole run, plus 'final_equity', 'n_periods' and 'output_dir' 
+        '''
+        if output_dir is not None: 
+            os.makedirs(output_dir, exist_ok = True)
+        state, equity_curves = None, []
+        for i, (close_position_df, prices_df) in enumerate(chunks): 
+            coins = close_position_df.columns.get_level_values(0).unique().to_list()
+            index = close_position_df.index
+            prices_df = prices_df.loc[index]
+            close_position = close_position_df[coins].to_numpy(dtype = self.dtypes['position'])
+            bid = prices_df.xs('bid', axis = 1, level = 1)[coins].to_numpy(dtype = self.dtypes['price'])
+            ask = prices_df.xs('ask', axis = 1, level = 1)[coins].to_numpy(dtype = self.dtypes['price'])
+            if state is None: 
+                empty = np.empty((0, len(coins)), dtype = bid.dtype)
+                state = {'close_position': np.zeros(len(coins), dtype = close_position.dtype), 'position': None, 'running_cash_gross': 0.0, 'running_cost': 0.0, 
+                         'tail': (index[:0], empty, empty, empty), 'liquidated': False}
+
+            if instant_execution: 
+                position = close_position.copy()
+            else: 
+                #1 period lag, the first period of the chunk executes the last desired position of the previous chunk 
+                position = np.vstack([state['close_position'][None], close_position[:-1]])
+            _, position = self.constraints.check_capital_limit_array(position, (bid + ask) / 2, lot_size = lot_size)
+            if state['liquidated']: 
+                position = np.zeros(position.shape, dtype = position.dtype)
+            if state['position'] is None: 
+                #First chunk: as backtest_arrays, the first period has no position change 
+                state['position'] = position[0]
+
+            pnl_calculator = self._run_arrays(index, coins, position, bid, ask, state = state)
+            if not state['liquidated']: 
+                breach = self.constraints.first_margin_call(pnl_calculator.cum_df['equity_curve'].to_numpy(), self.initial_capital)
+                if breach is not None: 
+                    self.is_liquidated = state['liquidated'] = True
+                    position = position.copy()
+                    position[breach + 1:] = 0.0
+                    pnl_calculator = self._run_arrays(index, coins, position, bid, ask, state = state)
+
+            if output_dir is not None: 
+                summary_df = self._calc_summary_df(pnl_calculator, pd.DataFrame(position, index = index, columns = coins))
+                summary_df.columns = ['/'.join(col) for col in summary_df.columns]
+                summary_df.to_parquet(os.path.join(output_dir, f'part-{i:05d}.parquet'))
+            equity_curves.append(pnl_calculator.cum_df['equity_curve'])
+            state = self._next_state(state, index, close_position, position, bid, ask, pnl_calculator)
+
+        equity_curve = pd.concat(equity_curves)
+        return {
+            **self.metrics_calc.risk_adjusted.get_all(equity_curve.diff(), self.initial_capital), 
+            'final_equity': equity_curve.iloc[-1], 
+            'n_periods': len(equity_curve), 
+            'output_dir': output_dir, 
+        }
 
-        return self._calc_results(pnl_calculator, position_df)
\ No newline at end of file
+def read_stream_results(output_dir: str) -> pd.DataFrame: 
+    '''summary_df of a backtest_stream run, from the chunks written to output_dir'''
+    parts = sorted(name for name in os.listdir(output_dir) if name.startswith('part-') and name.endswith('.parquet'))
+    summary_df = pd.concat([pd.read_parquet(os.path.join(output_dir, name)) for name in parts])
+    summary_df.columns = pd.MultiIndex.from_tuples([tuple(col.split('/', 1)) for col in summary_df.columns])
+    return summary_df
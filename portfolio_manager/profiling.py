@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import nullcontext
+from typing import Dict
+
+import pandas as pd
+
+#Shared no-op context returned by a disabled profiler, so instrumented code costs one method call per stage
+_NULL_STAGE = nullcontext()
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start_ns', 'start_bytes')
+
+    def __init__(self, profiler: 'StageProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.track_allocations:
+            self.start_bytes = tracemalloc.get_traced_memory()[0]
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end_ns = time.perf_counter_ns()
+        alloc_bytes = tracemalloc.get_traced_memory()[0] - self.start_bytes if self.profiler.track_allocations else 0
+        self.profiler._record(self.name, self.start_ns, end_ns, alloc_bytes)
+        return False
+
+class StageProfiler:
+    '''
+    Opt-in per-stage timers and counters for PortfolioManager.
+
+    Instrumented code wraps each stage in `with profiler.stage('name'):`. Disabled (the default), stage() returns a
+    shared no-op context. Enabled, every stage records calls and cumulative ns, plus net allocated bytes when
+    track_allocations = True (tracemalloc, which slows everything down) and one Chrome trace event per call when
+    trace = True (open the export_chrome_trace file in chrome://tracing or Perfetto). The loop backtest records several
+    events per bar, so only the last max_events are kept. Call close() when done with allocations.
+    '''
+    def __init__(self, enabled: bool = False, track_allocations: bool = False, trace: bool = False, max_events: int = 100_000):
+        self.enabled = enabled
+        self.track_allocations = track_allocations
+        self.trace = trace
+        self.max_events = max_events
+        self._started_tracing = False
+        self.reset()
+
+    def reset(self):
+        self.calls: Dict[str, int] = {}
+        self.total_ns: Dict[str, int] = {}
+        self.alloc_bytes: Dict[str, int] = {}
+        self.events = deque(maxlen = self.max_events)
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        if self.track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return _Stage(self, name)
+
+    def close(self):
+        '''Stop tracemalloc if this profiler started it'''
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _record(self, name: str, start_ns: int, end_ns: int, alloc_bytes: int):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.total_ns[name] = self.total_ns.get(name, 0) + end_ns - start_ns
+        self.alloc_bytes[name] = self.alloc_bytes.get(name, 0) + alloc_bytes
+        if self.trace:
+            self.events.append((name, start_ns, end_ns))
+
+    def report(self) -> pd.DataFrame:
+        '''One row per stage: calls, total/mean time and share of the instrumented time, sorted by total time'''
+        report_df = pd.DataFrame({
+            'calls': pd.Series(self.calls, dtype = 'int64'),
+            'total_ns': pd.Series(self.total_ns, dtype = 'int64'),
+            'alloc_bytes': pd.Series(self.alloc_bytes, dtype = 'int64'),
+        })
+        report_df['total_seconds'] = report_df['total_ns'] / 1e9
+        report_df['mean_us'] = report_df['total_ns'] / report_df['calls'] / 1e3
+        report_df['share'] = report_df['total_ns'] / report_df['total_ns'].sum()
+        if not self.track_allocations:
+            report_df = report_df.drop(columns = 'alloc_bytes')
+        return report_df.sort_values('total_ns', ascending = False)
+
+    def chrome_trace(self) -> Dict:
+        '''Trace events in the Chrome trace event format (complete events, microseconds)'''
+        pid, tid = os.getpid(), threading.get_ident()
+        return {
+            'traceEvents': [
+                {'name': name, 'cat': 'backtest', 'ph': 'X', 'ts': start_ns / 1e3, 'dur': (end_ns - start_ns) / 1e3, 'pid': pid, 'tid': tid}
+                for name, start_ns, end_ns in self.events
+            ],
+            'displayTimeUnit': 'ms',
+        }
+
+    def export_chrome_trace(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
@@ -1,13 +1,19 @@
+import numpy as np
 import pandas as pd 
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from .constants import DEFAULT_HOURLY_INTEREST_RATE
 
+INTEREST_METHODS = ['upper_bound', 'time_weighted']
+
 class CostCalculator:
     """Handles cost calculations per trade"""
     
-    def __init__(self, transaction_cost_rate: float, hourly_interest_rate_by_coin: Dict[str, float]):
+    def __init__(self, transaction_cost_rate: float, hourly_interest_rate_by_coin: Dict[str, float], interest_method: str = 'upper_bound'):
+        if interest_method not in INTEREST_METHODS: 
+            raise ValueError(f'interest_method must be one of {INTEREST_METHODS}, got {interest_method}')
         self.transaction_cost_rate = transaction_cost_rate
         self.hourly_interest_rate_by_coin = hourly_interest_rate_by_coin
+        self.interest_method = interest_method
 
     def _calc_interest(self, position_history_df: Optional[pd.DataFrame], 
                       prices_df: Optional[pd.DataFrame]) -> Dict[str, float]: 
@@ -37,4 +43,75 @@ class CostCalculator:
         return {
             'spot': pd.Series(self._calc_spot_fees(position_change, current_price)),
             'interest': pd.Series(self._calc_interest(position_history_df, price_history_df))
-        }
\ No newline at end of file
+        }
+
+    #Array versions - operate on (n_periods, n_coins) arrays for the whole backtest at once 
+    def calc_spot_fees_array(self, position_change: np.ndarray, bid: np.ndarray, ask: np.ndarray) -> np.ndarray:
+        '''Spot fees for every period and coin: buy long = ask, sell = bid'''
+        fill_price = np.where(position_change > 0, ask, bid)
+        return np.abs(position_change * fill_price) * self.transaction_cost_rate
+
+    def calc_interest_array(self, index: pd.DatetimeIndex, position: np.ndarray, bid: np.ndarray, ask: np.ndarray, 
+                            coins: List[str], method: str = None) -> np.ndarray:
+        '''
+        Hourly borrow interest for every period and coin, charged at the top of each hour on the previous hour [t - 1h, t). 
+        All hours are computed in one pass over the short exposure arrays. 
+
+        method (defaults to self.interest_method): 
+            - 'upper_bound': max short units * max bid/ask price * hourly rate, as _calc_interest. 
+               Coins without a short position in the window are NaN 
+            - 'time_weighted': sum over bars of short units * max bid/ask price * hourly rate * hours until the next bar 
+        Periods without a charge are 0. 
+        '''
+        method = method or self.interest_method
+        if method not in INTEREST_METHODS: 
+            raise ValueError(f'method must be one of {INTEREST_METHODS}, got {method}')
+        #Charges in the arrays' dtype (float32 in compact precision), summed in float64 by the PnL ledger 
+        interest = np.zeros(position.shape, dtype = np.result_type(position, bid))
+        charge_rows = np.flatnonzero(is_top_of_hour(index))
+        if not len(charge_rows): 
+            return interest
+
+        #Window for row i is [t_i - 1 hour, t_i)
+        starts = index.searchsorted(index[charge_rows] - pd.Timedelta(hours=1), side='left')
+        rates = np.array([self.hourly_interest_rate_by_coin.get(coin, DEFAULT_HOURLY_INTEREST_RATE) for coin in coins])
+        max_price = np.maximum(bid, ask)
+        if method == 'upper_bound': 
+            short_units = np.where(position < 0, -position, np.nan)
+            max_short = _reduce_windows(np.fmax, short_units, starts, charge_rows)
+            interest[charge_rows] = max_short * _reduce_windows(np.maximum, max_price, starts, charge_rows) * rates
+        else: 
+            #Position at row i is held until row i + 1 
+            hours_held = np.append(np.diff(index.asi8), 0) * (pd.Timedelta(1, unit = index.unit) / pd.Timedelta(hours=1))
+            accrued = np.nan_to_num(np.where(position < 0, -position, 0.0) * max_price) * hours_held[:, None] * rates
+            interest[charge_rows] = np.nan_to_num(_reduce_windows(np.add, accrued, starts, charge_rows))
+        return interest
+
+    def calc_interest_df(self, position_df: pd.DataFrame, prices_df: pd.DataFrame, method: str = None) -> pd.DataFrame: 
+        '''calc_interest_array for a positions frame and a (coin, field) prices frame, aligned to position_df.index'''
+        coins = position_df.columns.to_list()
+        prices_df = prices_df.loc[position_df.index]
+        interest = self.calc_interest_array(
+            position_df.index, 
+            position_df.to_numpy(dtype = float), 
+            prices_df.xs('bid', axis = 1, level = 1)[coins].to_numpy(dtype = float), 
+            prices_df.xs('ask', axis = 1, level = 1)[coins].to_numpy(dtype = float), 
+            coins, 
+            method = method, 
+        )
+        return pd.DataFrame(interest, index = position_df.index, columns = coins)
+
+def is_top_of_hour(index: pd.DatetimeIndex) -> np.ndarray: 
+    '''Periods at which the previous hour of interest is charged'''
+    return (index.minute == 0) & (index.second == 0)
+
+def _reduce_windows(ufunc: np.ufunc, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray: 
+    '''Reduce rows of values over each [start, end) window with one reduceat call, empty windows give NaN'''
+    out = np.full((len(starts), values.shape[1]), np.nan)
+    non_empty = ends > starts
+    if non_empty.any(): 
+        #pad with one row so that window ends can point one past the last period 
+        padded = np.vstack([values, np.full((1, values.shape[1]), np.nan)])
+        bounds = np.column_stack([starts[non_empty], ends[non_empty]]).ravel()
+        out[non_empty] = ufunc.reduceat(padded, bounds, axis = 0)[::2]
+    return out
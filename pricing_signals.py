@@ -1,14 +1,53 @@
+from typing import Dict, Iterable, Iterator, List, Tuple
 import numpy as np
 import pandas as pd
 import statsmodels.api as sm
 from statsmodels.regression.rolling import RollingOLS
 
+from kalman_hedge import kalman_hedge, kalman_hedge_arrays
+from portfolio_manager.constants import PRECISION_DTYPES
+from rolling_ols import rolling_ols, rolling_ols_arrays
+
+HEDGE_BACKENDS = ['statsmodels', 'streaming', 'kalman']
+SIGNAL_COLUMNS = ['z_score', 'spread', 'beta']
+PANEL_LAYOUTS = ['wide', 'long']
+
 class PricingSignal: 
-    def __init__(self, hedge_lookback, spread_lookback):
+    def __init__(self, hedge_lookback, spread_lookback, backend: str = 'statsmodels', halflife: float = None, 
+                 delta: float = None, observation_variance: float = None, precision: str = 'float64'):
+        '''
+        Args: 
+            backend: 'statsmodels' (RollingOLS), 'streaming' (single pass rolling_ols kernel) or 'kalman' (kalman_hedge, 
+                hedge_lookback is then only the warm up)
+            halflife: exponential weighting of the hedge regression, streaming backend only 
+            delta, observation_variance: state noise and residual variance of the kalman backend (None = kalman_hedge defaults)
+            precision: 'compact' returns float32 signals (computed in float64, see PRECISION_DTYPES)
+        '''
+        if backend not in HEDGE_BACKENDS: 
+            raise ValueError(f"backend must be one of {HEDGE_BACKENDS}, got {backend}")
+        if halflife is not None and backend != 'streaming': 
+            raise ValueError("halflife is only supported by the 'streaming' backend")
+        if (delta is not None or observation_variance is not None) and backend != 'kalman': 
+            raise ValueError("delta and observation_variance are only supported by the 'kalman' backend")
+        if precision not in PRECISION_DTYPES: 
+            raise ValueError(f"precision must be one of {list(PRECISION_DTYPES)}, got {precision}")
         self.hedge_window = hedge_lookback 
         self.spread_window = spread_lookback 
+        self.backend = backend 
+        self.halflife = halflife 
+        self.delta = delta 
+        self.observation_variance = observation_variance 
+        self.precision = precision 
     
     def _calculate_hedge_ratio(self, x, y, fit_intercept=True): 
+        if self.backend == 'streaming': 
+            ols = rolling_ols(x, y, window = self.hedge_window, fit_intercept = fit_intercept, halflife = self.halflife)
+            return ols['intercept'], ols['beta']
+        if self.backend == 'kalman': 
+            params = {name: value for name, value in [('delta', self.delta), ('observation_variance', self.observation_variance)] if value is not None}
+            kalman = kalman_hedge(x, y, warmup = self.hedge_window, fit_intercept = fit_intercept, **params)
+            return kalman['intercept'], kalman['beta']
+
         if fit_intercept:
             X = sm.add_constant(x)
             exog_idx = 1  # Beta is second column
@@ -54,8 +93,188 @@ class PricingSignal:
             'z_score': z_score,       # signal 
             'spread': spread,         # For analysis
             'beta': beta              # For position sizing
-        })
+        }, dtype = PRECISION_DTYPES[self.precision]['signal'])
+
+    def _hedge_ratio_arrays(self, x: np.ndarray, y: np.ndarray): 
+        '''(intercept, beta) for x, y (n_bars, n_pairs), every pair in one kernel call'''
+        if self.backend == 'kalman': 
+            params = {name: value for name, value in [('delta', self.delta), ('observation_variance', self.observation_variance)] if value is not None}
+            return kalman_hedge_arrays(x, y, warmup = self.hedge_window, **params)
+        #statsmodels backend too: RollingOLS has no batched form, the streaming kernel agrees with it up to rounding 
+        return rolling_ols_arrays(x, y, window = self.hedge_window, halflife = self.halflife)
+
+    def generate_panel_chunks(self, prices_df: pd.DataFrame, pairs: List[Tuple], chunk_size: int = 64, 
+                              layout: str = 'wide') -> Iterator[pd.DataFrame]: 
+        '''
+        _generate for many pairs of one price matrix, chunk_size pairs at a time. 
+
+        Each chunk's pairs are gathered into (n_bars, chunk_size) arrays: hedge ratios in one batched kernel call, spreads 
+        as array operations and z_scores as one rolling pass over the chunk, so memory is bounded by chunk_size pairs 
+        rather than the number of pairs. 
+
+        Args: 
+            prices_df: prices with coins as columns, e.g. mid prices 
+            pairs: (y, x) column positions or labels of prices_df 
+            layout: 'wide' - columns (pair, ['z_score', 'spread', 'beta']), so frame[pair] is _generate's output for it
+                    'long' - rows (pair, timestamp), columns ['z_score', 'spread', 'beta']
+            Pairs are labelled 'y/x'. 
+        '''
+        if layout not in PANEL_LAYOUTS: 
+            raise ValueError(f'layout must be one of {PANEL_LAYOUTS}, got {layout}')
+        columns = prices_df.columns
+        positions = [tuple(column if isinstance(column, (int, np.integer)) else columns.get_loc(column) for column in pair) for pair in pairs]
+        prices = prices_df.to_numpy(dtype = float)
+        for start in range(0, len(positions), chunk_size): 
+            y_cols, x_cols = map(list, zip(*positions[start: start + chunk_size]))
+            labels = [f'{columns[y_col]}/{columns[x_col]}' for y_col, x_col in zip(y_cols, x_cols)]
+            y, x = prices[:, y_cols], prices[:, x_cols]
+            intercept, beta = self._hedge_ratio_arrays(x, y)
+            spread = y - intercept - beta * x
+            spread_df = pd.DataFrame(spread, index = prices_df.index, columns = labels)
+            rolling = spread_df.rolling(self.spread_window)
+            z_score = ((spread_df - rolling.mean()) / rolling.std()).to_numpy()
+            dtype = PRECISION_DTYPES[self.precision]['signal']
+            z_score, spread, beta = (values.astype(dtype, copy = False) for values in (z_score, spread, beta))
+
+            if layout == 'wide': 
+                #(n_bars, n_pairs, 3) -> (n_bars, n_pairs * 3), pair major as the MultiIndex columns 
+                values = np.stack([z_score, spread, beta], axis = 2).reshape(len(prices_df), -1)
+                yield pd.DataFrame(values, index = prices_df.index, columns = pd.MultiIndex.from_product([labels, SIGNAL_COLUMNS]))
+            else: 
+                index = pd.MultiIndex.from_product([labels, prices_df.index], names = ['pair', prices_df.index.name])
+                yield pd.DataFrame({
+                    'z_score': z_score.ravel(order = 'F'), 'spread': spread.ravel(order = 'F'), 'beta': beta.ravel(order = 'F')
+                }, index = index)
+
+    def generate_panel(self, prices_df: pd.DataFrame, pairs: List[Tuple], chunk_size: int = 64, layout: str = 'wide') -> pd.DataFrame: 
+        '''All chunks of generate_panel_chunks in one frame'''
+        chunks = list(self.generate_panel_chunks(prices_df, pairs, chunk_size = chunk_size, layout = layout))
+        return pd.concat(chunks, axis = 1 if layout == 'wide' else 0)
+
+    def generate_chunks(self, chunks: Iterable[Tuple[pd.Series, pd.Series]]) -> Iterator[pd.DataFrame]: 
+        '''
+        _generate over consecutive (x, y) chunks, e.g. alongside PortfolioManager.backtest_stream. 
+        Only the last hedge_lookback + spread_lookback - 1 bars are carried, which is every bar the rolling windows of the 
+        next chunk can reach, so each row matches _generate on the whole series up to rounding of the rolling sums. 
+        Chunks may be shorter than hedge_lookback: until one hedge window of bars has arrived the rows are NaN, as in _generate. 
+        '''
+        if self.halflife is not None or self.backend == 'kalman': 
+            raise ValueError('Exponentially weighted and Kalman hedge ratios depend on the whole history, use a hard window')
+        n_tail = self.hedge_window + self.spread_window - 1
+        tail_x = tail_y = None
+        for x, y in chunks: 
+            n_new = len(x)
+            if tail_x is not None: 
+                x, y = pd.concat([tail_x, x]), pd.concat([tail_y, y])
+            if len(x) < self.hedge_window: 
+                #Too few bars to fit (RollingOLS raises), every bar so far is carried to the next chunk 
+                yield pd.DataFrame(np.nan, index = x.index[len(x) - n_new:], columns = SIGNAL_COLUMNS, 
+                                   dtype = PRECISION_DTYPES[self.precision]['signal'])
+            else: 
+                signal_df = self._generate(x, y)
+                yield signal_df.iloc[len(signal_df) - n_new:]
+            tail_x, tail_y = x.iloc[-n_tail:], y.iloc[-n_tail:]
     
+class _RollingMoments: 
+    '''Ring buffer of (x, y) observations with O(1) Welford add/remove of means and co-moments'''
+    def __init__(self, window: int): 
+        self.window = window 
+        self.x = np.full(window, np.nan)
+        self.y = np.full(window, np.nan)
+        self.cursor = 0 #number of observations pushed so far, slot = cursor % window 
+        self.nobs = 0 #non-NaN observations in the buffer 
+        self.mean_x = self.mean_y = self.sxx = self.sxy = 0.0
+
+    def push(self, x_t: float, y_t: float): 
+        slot = self.cursor % self.window
+        x_old, y_old = self.x[slot], self.y[slot]
+        if self.cursor >= self.window and not (np.isnan(x_old) or np.isnan(y_old)): 
+            self._remove(x_old, y_old)
+        self.x[slot], self.y[slot] = x_t, y_t
+        if not (np.isnan(x_t) or np.isnan(y_t)): 
+            self._add(x_t, y_t)
+        self.cursor += 1
+
+    def _add(self, x_t, y_t): 
+        self.nobs += 1
+        dx = x_t - self.mean_x
+        self.mean_x += dx / self.nobs
+        self.mean_y += (y_t - self.mean_y) / self.nobs
+        self.sxx += dx * (x_t - self.mean_x)
+        self.sxy += dx * (y_t - self.mean_y)
+
+    def _remove(self, x_t, y_t): 
+        self.nobs -= 1
+        if self.nobs == 0: 
+            self.mean_x = self.mean_y = self.sxx = self.sxy = 0.0
+            return
+        dx = x_t - self.mean_x
+        self.mean_x -= dx / self.nobs
+        self.mean_y -= (y_t - self.mean_y) / self.nobs
+        self.sxx -= dx * (x_t - self.mean_x)
+        self.sxy -= dx * (y_t - self.mean_y)
+
+    @property
+    def is_full(self) -> bool: 
+        return self.cursor >= self.window
+
+class OnlinePricingSignal: 
+    '''
+    Bar by bar version of PricingSignal._generate for live use: O(1) per tick. 
+
+    Keeps fixed size ring buffers for the hedge window (x, y) and the spread window (spread), 
+    so update(x_t, y_t) gives the same (z_score, spread, beta) as the last row of _generate on the full history. 
+    '''
+    def __init__(self, hedge_lookback: int, spread_lookback: int): 
+        self.hedge_window = hedge_lookback 
+        self.spread_window = spread_lookback 
+        self._hedge = _RollingMoments(hedge_lookback)
+        #spread stored as x with y unused - only the mean/variance of x are needed 
+        self._spread = _RollingMoments(spread_lookback)
+
+    def update(self, x_t: float, y_t: float): 
+        '''Feed one bar, returns (z_score, spread, beta) for this bar (NaN during warm up)'''
+        hedge = self._hedge
+        hedge.push(x_t, y_t)
+        beta = intercept = np.nan
+        #RollingOLS needs a full window and at least 2 observations (constant + x)
+        if hedge.is_full and hedge.nobs >= 2 and hedge.sxx > 0: 
+            beta = hedge.sxy / hedge.sxx
+            intercept = hedge.mean_y - beta * hedge.mean_x
+        spread = y_t - intercept - beta * x_t
+
+        window = self._spread
+        window.push(spread, 0.0)
+        z_score = np.nan
+        #pandas rolling: full window without NaN, std with ddof = 1 
+        if window.is_full and window.nobs == self.spread_window and window.nobs > 1: 
+            std = np.sqrt(max(window.sxx, 0.0) / (window.nobs - 1))
+            z_score = (spread - window.mean_x) / std
+        return z_score, spread, beta 
+
+    def snapshot(self) -> Dict: 
+        '''Copy of the full state, picklable - pass to restore() to resume without replaying history'''
+        return {
+            'hedge_lookback': self.hedge_window, 
+            'spread_lookback': self.spread_window, 
+            'hedge': _moments_state(self._hedge), 
+            'spread': _moments_state(self._spread), 
+        }
+
+    @classmethod
+    def restore(cls, snapshot: Dict) -> 'OnlinePricingSignal': 
+        signal = cls(snapshot['hedge_lookback'], snapshot['spread_lookback'])
+        for moments, state in [(signal._hedge, snapshot['hedge']), (signal._spread, snapshot['spread'])]: 
+            for key, value in state.items(): 
+                setattr(moments, key, value.copy() if isinstance(value, np.ndarray) else value)
+        return signal
+
+def _moments_state(moments: _RollingMoments) -> Dict: 
+    return {
+        'x': moments.x.copy(), 'y': moments.y.copy(), 'cursor': moments.cursor, 'nobs': moments.nobs, 
+        'mean_x': moments.mean_x, 'mean_y': moments.mean_y, 'sxx': moments.sxx, 'sxy': moments.sxy, 
+    }
+
 def generate_pricing_signal_test_data(n_periods=200, 
                                       freq='H', 
                                       start_date='2024-01-01',
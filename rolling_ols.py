@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from numba_compat import njit
+
+@njit(cache = True)
+def _rolling_ols_kernel(x, y, window, fit_intercept, alpha, min_nobs):
+    '''
+    Single pass rolling regression y = intercept + beta * x.
+
+    Keeps running means and co-moments (Welford updates: add the new bar, remove the bar leaving the window)
+    instead of raw sums of x, y, x^2, xy, which avoids cancellation on large price levels.
+    alpha > 0 switches to exponentially weighted statistics over the full history (window only sets the warm up).
+    NaN observations are dropped from the window, as RollingOLS(missing='drop').
+    '''
+    n = len(x)
+    #Without an intercept, intercept is 0.0 everywhere as in PricingSignal._calculate_hedge_ratio 
+    intercept = np.full(n, np.nan) if fit_intercept else np.zeros(n)
+    beta = np.full(n, np.nan)
+    decay = 1.0 - alpha
+    weight = 0.0 #number of observations, or sum of weights when exponentially weighted
+    nobs = 0
+    mean_x = 0.0
+    mean_y = 0.0
+    sxx = 0.0
+    sxy = 0.0
+    for i in range(n):
+        #Add bar i
+        if not (np.isnan(x[i]) or np.isnan(y[i])):
+            if alpha > 0:
+                weight = decay * weight + 1.0
+                sxx *= decay
+                sxy *= decay
+            else:
+                weight += 1.0
+            nobs += 1
+            dx = x[i] - mean_x
+            mean_x += dx / weight
+            mean_y += (y[i] - mean_y) / weight
+            sxx += dx * (x[i] - mean_x)
+            sxy += dx * (y[i] - mean_y)
+
+        #Remove bar i - window
+        j = i - window
+        if alpha == 0 and j >= 0 and not (np.isnan(x[j]) or np.isnan(y[j])):
+            weight -= 1.0
+            nobs -= 1
+            if weight > 0:
+                dx = x[j] - mean_x
+                mean_x -= dx / weight
+                mean_y -= (y[j] - mean_y) / weight
+                sxx -= dx * (x[j] - mean_x)
+                sxy -= dx * (y[j] - mean_y)
+            else:
+                mean_x = mean_y = sxx = sxy = 0.0
+
+        if i < window - 1 or nobs < min_nobs:
+            continue
+        if fit_intercept:
+            if sxx > 0:
+                beta[i] = sxy / sxx
+                intercept[i] = mean_y - beta[i] * mean_x
+        else:
+            #Raw second moments recovered from the centred ones
+            sum_xx = sxx + weight * mean_x * mean_x
+            if sum_xx > 0:
+                beta[i] = (sxy + weight * mean_x * mean_y) / sum_xx
+    return intercept, beta
+
+@njit(cache = True)
+def _rolling_ols_panel_kernel(x, y, window, fit_intercept, alpha, min_nobs):
+    '''_rolling_ols_kernel for every row of x, y (n_pairs, n_bars) in one compiled call'''
+    intercept = np.empty_like(x)
+    beta = np.empty_like(x)
+    for j in range(x.shape[0]):
+        intercept[j], beta[j] = _rolling_ols_kernel(x[j], y[j], window, fit_intercept, alpha, min_nobs)
+    return intercept, beta
+
+def rolling_ols_arrays(x: np.ndarray, y: np.ndarray, window: int, fit_intercept: bool = True, halflife: float = None):
+    '''
+    rolling_ols for a stack of pairs: x, y (n_bars, n_pairs), column j of y regressed on column j of x.
+    Returns (intercept, beta) arrays shaped as x, each column equal to rolling_ols on that pair.
+    '''
+    alpha = 0.0 if halflife is None else 1.0 - np.exp(np.log(0.5) / halflife)
+    min_nobs = 2 if fit_intercept else 1
+    #Pairs as contiguous rows, so the kernel walks each pair's bars in memory order
+    intercept, beta = _rolling_ols_panel_kernel(np.ascontiguousarray(np.asarray(x, dtype = float).T),
+                                                np.ascontiguousarray(np.asarray(y, dtype = float).T),
+                                                int(window), fit_intercept, alpha, min_nobs)
+    return intercept.T, beta.T
+
+def rolling_ols(x: pd.Series, y: pd.Series, window: int, fit_intercept: bool = True, halflife: float = None) -> pd.DataFrame:
+    '''
+    Rolling OLS of y on x in one O(n) pass.
+
+    Args:
+        window: number of bars in the regression window (warm up period when halflife is set)
+        fit_intercept: if False, regress through the origin (intercept is 0)
+        halflife: if set, exponentially weight observations with this halflife in bars instead of a hard window
+    Returns:
+        DataFrame with ['intercept', 'beta', 'spread'], spread = y - intercept - beta * x
+    '''
+    x_arr = x.to_numpy(dtype = float)
+    y_arr = y.reindex(x.index).to_numpy(dtype = float)
+    alpha = 0.0 if halflife is None else 1.0 - np.exp(np.log(0.5) / halflife)
+    min_nobs = 2 if fit_intercept else 1
+    intercept, beta = _rolling_ols_kernel(x_arr, y_arr, int(window), fit_intercept, alpha, min_nobs)
+    return pd.DataFrame({
+        'intercept': intercept,
+        'beta': beta,
+        'spread': y_arr - intercept - beta * x_arr,
+    }, index = x.index)
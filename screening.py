@@ -0,0 +1,184 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.adfvalues import mackinnonp
+from tqdm import tqdm
+
+from shared_arrays import SharedArrays, attach_shared_arrays
+
+KEY_COLUMNS = ['y', 'x', 'start', 'end', 'n_lags']
+
+def engle_granger_batch(y: np.ndarray, x: np.ndarray, n_lags: int = 1) -> Dict[str, np.ndarray]:
+    '''
+    Engle-Granger step 1 and 2 for a stack of pairs at once.
+
+    Args:
+        y, x: (n_periods, n_pairs) prices, column p is one pair. NaN rows are dropped per pair
+        n_lags: fixed number of lagged differences in the ADF regression (no autolag)
+    Returns:
+        dict of (n_pairs,) arrays: n_obs, intercept, beta, adf_stat, adf_pvalue
+    '''
+    #Step 1 - stacked least squares y = intercept + beta * x, in closed form per column
+    valid = ~(np.isnan(y) | np.isnan(x))
+    n_obs = valid.sum(axis = 0)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean_x = np.where(valid, x, 0).sum(axis = 0) / n_obs
+        mean_y = np.where(valid, y, 0).sum(axis = 0) / n_obs
+        dx = np.where(valid, x - mean_x, 0)
+        dy = np.where(valid, y - mean_y, 0)
+        beta = (dx * dy).sum(axis = 0) / (dx * dx).sum(axis = 0)
+    intercept = mean_y - beta * mean_x
+    resid = y - intercept - beta * x
+
+    #Step 2 - ADF on the residuals, no constant (as statsmodels coint)
+    adf_stat = adf_batch(resid, n_lags = n_lags)
+    #Cointegration (N = 2 variables) critical values, not plain ADF ones
+    adf_pvalue = np.array([mackinnonp(stat, regression = 'c', N = 2) if np.isfinite(stat) else np.nan for stat in adf_stat])
+    return {
+        'n_obs': n_obs,
+        'intercept': intercept,
+        'beta': beta,
+        'adf_stat': adf_stat,
+        'adf_pvalue': adf_pvalue,
+    }
+
+def adf_batch(series: np.ndarray, n_lags: int = 1) -> np.ndarray:
+    '''
+    ADF t-statistics without constant for every column of series (n_periods, n_series):
+        diff_t = gamma * level_{t-1} + sum_l phi_l * diff_{t-l} + e_t
+    The lag matrices are shared by all columns; the (n_lags + 1)^2 normal equations are solved per column in one call.
+    Matches adfuller(..., maxlag = n_lags, autolag = None, regression = 'n').
+    '''
+    diff = np.diff(series, axis = 0)
+    n_rows = len(diff) - n_lags
+    target = diff[n_lags:]
+    regressors = [series[n_lags:-1]] + [diff[n_lags - lag: n_lags - lag + n_rows] for lag in range(1, n_lags + 1)]
+
+    #Drop rows with any NaN by zeroing them out of the normal equations
+    valid = ~np.isnan(target)
+    for regressor in regressors:
+        valid &= ~np.isnan(regressor)
+    target = np.where(valid, target, 0)
+    regressors = [np.where(valid, regressor, 0) for regressor in regressors]
+
+    k = len(regressors)
+    xtx = np.empty((series.shape[1], k, k))
+    xty = np.empty((series.shape[1], k))
+    for i in range(k):
+        xty[:, i] = (regressors[i] * target).sum(axis = 0)
+        for j in range(i, k):
+            xtx[:, i, j] = xtx[:, j, i] = (regressors[i] * regressors[j]).sum(axis = 0)
+
+    n_obs = valid.sum(axis = 0)
+    adf_stat = np.full(series.shape[1], np.nan)
+    #Columns without enough observations or with singular designs are left as NaN
+    ok = (n_obs > k) & (np.linalg.matrix_rank(xtx) == k)
+    if not ok.any():
+        return adf_stat
+    xtx_inv = np.linalg.inv(xtx[ok])
+    coef = np.einsum('pij,pj->pi', xtx_inv, xty[ok])
+    fitted = sum(regressors[i][:, ok] * coef[:, i] for i in range(k))
+    ssr = ((target[:, ok] - fitted) ** 2).sum(axis = 0)
+    sigma2 = ssr / (n_obs[ok] - k)
+    adf_stat[ok] = coef[:, 0] / np.sqrt(sigma2 * xtx_inv[:, 0, 0])
+    return adf_stat
+
+class ScreeningCache:
+    '''Screening results keyed by (y, x, start, end, n_lags), optionally persisted to a pickle file'''
+    def __init__(self, path: str = None):
+        self.path = path
+        if path is not None and os.path.exists(path):
+            self.results_df = pd.read_pickle(path)
+        else:
+            self.results_df = pd.DataFrame(columns = KEY_COLUMNS)
+
+    def missing(self, keys: pd.DataFrame) -> pd.DataFrame:
+        '''Rows of keys that have not been screened yet'''
+        merged = keys.merge(self.results_df[KEY_COLUMNS], on = KEY_COLUMNS, how = 'left', indicator = True)
+        return keys[(merged['_merge'] == 'left_only').to_numpy()]
+
+    def add(self, results_df: pd.DataFrame):
+        if not len(results_df):
+            return
+        frames = [df for df in (self.results_df, results_df) if len(df)]
+        self.results_df = pd.concat(frames, ignore_index = True).drop_duplicates(KEY_COLUMNS, keep = 'last')
+        if self.path is not None:
+            self.results_df.to_pickle(self.path)
+
+    def get(self, keys: pd.DataFrame) -> pd.DataFrame:
+        return keys.merge(self.results_df, on = KEY_COLUMNS, how = 'inner')
+
+#Per-process state, set once by _init_worker
+_WORKER = {}
+
+def _init_worker(specs):
+    arrays, handles = attach_shared_arrays(specs)
+    _WORKER.update(arrays = arrays, handles = handles)
+
+def _close_worker():
+    #Drop the views before closing the blocks they point into
+    handles = _WORKER.pop('handles', [])
+    _WORKER.clear()
+    for shm in handles:
+        shm.close()
+
+def _screen_chunk(row_start: int, row_stop: int, y_cols: np.ndarray, x_cols: np.ndarray, n_lags: int) -> Dict[str, np.ndarray]:
+    prices = _WORKER['arrays']['prices']
+    return engle_granger_batch(prices[row_start:row_stop, y_cols], prices[row_start:row_stop, x_cols], n_lags = n_lags)
+
+def screen_pairs(prices_df: pd.DataFrame,
+                 pairs: List[Tuple[str, str]],
+                 windows: List[Tuple[pd.Timestamp, pd.Timestamp]] = None,
+                 n_lags: int = 1,
+                 cache: ScreeningCache = None,
+                 chunk_size: int = 64,
+                 max_workers: int = None) -> pd.DataFrame:
+    '''
+    Engle-Granger hedge fit and ADF statistic for every (y, x) pair and [start, end] window.
+
+    Pairs are screened in chunks of chunk_size as stacked least squares (engle_granger_batch), chunks run in a
+    process pool reading prices from shared memory. With a cache, only (pair, window) combinations that have not
+    been screened before are computed - e.g. after adding a day of data, pass the new day as an extra window.
+
+    Args:
+        prices_df: prices with coins as columns, e.g. mid prices
+        pairs: (y, x) coin pairs, e.g. list(zip(ssd_df['coin1'], ssd_df['coin2'])) from an SSD shortlist
+        windows: list of (start, end) timestamps, inclusive. Defaults to the full index
+    Returns:
+        DataFrame with one row per (pair, window): y, x, start, end, n_lags, n_obs, intercept, beta, adf_stat, adf_pvalue
+    '''
+    if windows is None:
+        windows = [(prices_df.index[0], prices_df.index[-1])]
+    cache = cache if cache is not None else ScreeningCache()
+    keys = pd.DataFrame(
+        [(y, x, pd.Timestamp(start), pd.Timestamp(end), n_lags) for start, end in windows for y, x in pairs],
+        columns = KEY_COLUMNS
+    )
+    todo = cache.missing(keys)
+
+    column_idx = {coin: i for i, coin in enumerate(prices_df.columns)}
+    tasks = []
+    for (start, end), window_df in todo.groupby(['start', 'end'], sort = False):
+        row_start, row_stop = prices_df.index.searchsorted(start, side = 'left'), prices_df.index.searchsorted(end, side = 'right')
+        for chunk_start in range(0, len(window_df), chunk_size):
+            chunk = window_df.iloc[chunk_start: chunk_start + chunk_size]
+            tasks.append((chunk, (row_start, row_stop, chunk['y'].map(column_idx).to_numpy(), chunk['x'].map(column_idx).to_numpy(), n_lags)))
+
+    results = []
+    if tasks:
+        task_args = [args for _, args in tasks]
+        with SharedArrays({'prices': prices_df.to_numpy(dtype = float)}) as shared:
+            if max_workers == 1:
+                _init_worker(shared.specs)
+                outputs = [_screen_chunk(*args) for args in tqdm(task_args, desc = 'screening')]
+                _close_worker()
+            else:
+                with ProcessPoolExecutor(max_workers = max_workers, initializer = _init_worker, initargs = (shared.specs,)) as pool:
+                    outputs = list(tqdm(pool.map(_screen_chunk, *zip(*task_args)), total = len(tasks), desc = 'screening'))
+        results = [chunk.assign(**output) for (chunk, _), output in zip(tasks, outputs)]
+
+    cache.add(pd.concat(results, ignore_index = True) if results else pd.DataFrame(columns = KEY_COLUMNS))
+    return cache.get(keys)
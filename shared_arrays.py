@@ -0,0 +1,38 @@
+'''Named numpy arrays in shared memory, created once by the parent and attached zero-copy by worker processes'''
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+class SharedArrays:
+    '''Copy named numpy arrays into shared memory once so that worker processes can attach without pickling'''
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self._blocks = {}
+        self.specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype = array.dtype, buffer = shm.buf)[...] = array
+            self._blocks[name] = shm
+            self.specs[name] = (shm.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for shm in self._blocks.values():
+            shm.close()
+            shm.unlink()
+        self._blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def attach_shared_arrays(specs: Dict[str, Tuple[str, tuple, str]]) -> Tuple[Dict[str, np.ndarray], list]:
+    '''Worker side: zero-copy views onto the blocks created by SharedArrays (keep the handles alive while in use)'''
+    handles, arrays = [], {}
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name = shm_name)
+        handles.append(shm)
+        arrays[name] = np.ndarray(shape, dtype = np.dtype(dtype), buffer = shm.buf)
+    return arrays, handles
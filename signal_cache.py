@@ -0,0 +1,132 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from helpers import calculate_rolling_ols_spread_fast
+
+INDEX_COLUMN = '__index__'
+
+def _array_bytes(values) -> bytes:
+    values = np.asarray(values)
+    if values.dtype == object:
+        #Object arrays hold pointers, hash the contents instead
+        values = pd.util.hash_array(values.ravel())
+    return repr((values.shape, values.dtype.str)).encode() + np.ascontiguousarray(values).tobytes()
+
+def fingerprint(*data) -> str:
+    '''Content hash of Series/DataFrames/arrays (values, index and column labels)'''
+    digest = hashlib.blake2b(digest_size = 16)
+    for obj in data:
+        if isinstance(obj, (pd.Series, pd.DataFrame)):
+            #index.values drops the timezone, the dtype keeps it ('datetime64[ns, UTC]')
+            digest.update(_array_bytes(obj.index.values) + str(obj.index.dtype).encode())
+            labels = obj.columns if isinstance(obj, pd.DataFrame) else [obj.name]
+            digest.update(repr(list(labels)).encode())
+            obj = obj.to_numpy()
+        digest.update(_array_bytes(obj))
+    return digest.hexdigest()
+
+class SignalCache:
+    '''
+    Content addressed cache of computed spreads/signals.
+
+    Key = hash of (input data fingerprint, pair, parameters), so a cached result is only reused for exactly the same
+    prices and parameters. Two tiers:
+        - in-process memo: the last memo_size results, no IO
+        - on disk: one uncompressed Arrow (feather) file per result, partitioned by pair, read memory-mapped.
+          Least recently used files are evicted when the directory grows beyond max_bytes
+    '''
+    def __init__(self, root: str, max_bytes: int = 10 * 1024**3, memo_size: int = 32):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        os.makedirs(root, exist_ok = True)
+
+    def key(self, data_fingerprint: str, pair: tuple, **params) -> str:
+        payload = json.dumps({'data': data_fingerprint, 'pair': list(pair), **params}, sort_keys = True, default = str)
+        return hashlib.blake2b(payload.encode(), digest_size = 16).hexdigest()
+
+    def _path(self, key: str, pair: tuple) -> str:
+        return os.path.join(self.root, 'pair=' + '_'.join(map(str, pair)), f'{key}.arrow')
+
+    def get(self, key: str, pair: tuple) -> pd.DataFrame:
+        '''Cached result or None'''
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key]
+        path = self._path(key, pair)
+        if not os.path.exists(path):
+            return None
+        df = feather.read_table(path, memory_map = True).to_pandas().set_index(INDEX_COLUMN)
+        df.index.name = None
+        #Mark as recently used for eviction
+        os.utime(path)
+        self._remember(key, df)
+        return df
+
+    def put(self, key: str, pair: tuple, df: pd.DataFrame):
+        path = self._path(key, pair)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        table = pa.Table.from_pandas(df.rename_axis(INDEX_COLUMN).reset_index(), preserve_index = False)
+        #Write then rename so that a concurrent reader never sees a partial file
+        feather.write_feather(table, path + '.tmp', compression = 'uncompressed')
+        os.replace(path + '.tmp', path)
+        self._remember(key, df)
+        self._evict()
+
+    def get_or_compute(self, key: str, pair: tuple, compute: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        df = self.get(key, pair)
+        if df is None:
+            df = compute()
+            self.put(key, pair, df)
+        return df
+
+    def _remember(self, key: str, df: pd.DataFrame):
+        self._memo[key] = df
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last = False)
+
+    def _evict(self, max_bytes: int = None):
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.arrow'):
+                    path = os.path.join(dirpath, filename)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        self._memo.clear()
+        self._evict(max_bytes = 0)
+
+    #Cached versions of the pipeline stages
+    def pricing_signal(self, signal, x: pd.Series, y: pd.Series) -> pd.DataFrame:
+        '''Cached PricingSignal._generate(x, y)'''
+        pair = (y.name, x.name)
+        key = self.key(fingerprint(x, y), pair, stage = 'pricing_signal',
+                       hedge_lookback = signal.hedge_window, spread_lookback = signal.spread_window,
+                       backend = signal.backend, halflife = signal.halflife,
+                       delta = signal.delta, observation_variance = signal.observation_variance, precision = signal.precision)
+        return self.get_or_compute(key, pair, lambda: signal._generate(x, y))
+
+    def rolling_ols_spread(self, df: pd.DataFrame, asset_a: str, asset_b: str, window: int) -> pd.DataFrame:
+        '''Cached calculate_rolling_ols_spread_fast(df, asset_a, asset_b, window)'''
+        pair = (asset_a, asset_b)
+        key = self.key(fingerprint(df[[asset_a, asset_b]]), pair, stage = 'rolling_ols_spread', hedge_lookback = window, backend = 'streaming')
+        return self.get_or_compute(key, pair, lambda: calculate_rolling_ols_spread_fast(df, asset_a, asset_b, window))
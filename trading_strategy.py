@@ -1,11 +1,22 @@
+from typing import List, Tuple
 import pandas as pd 
 import numpy as np
 import matplotlib.pyplot as plt 
 
+from numba_compat import njit
+from portfolio_manager.constants import PRECISION_DTYPES
+
+ACTION_COLUMNS = ['enter_long', 'enter_short', 'exit']
+POSITION_COLUMNS = ['position_y', 'position_x']
+
 class BollingerBandTradeStrategy:
-    def __init__(self, entry_threshold, exit_threshold):
+    def __init__(self, entry_threshold, exit_threshold, precision: str = 'float64'):
+        '''precision: 'compact' returns int8 actions and float32 positions from the fast methods (PRECISION_DTYPES)'''
+        if precision not in PRECISION_DTYPES: 
+            raise ValueError(f"precision must be one of {list(PRECISION_DTYPES)}, got {precision}")
         self.entry_threshold = entry_threshold
         self.exit_threshold = exit_threshold
+        self.precision = precision
 
     def get_positions(self, z_score: pd.Series, beta: pd.Series) -> pd.Series: 
         '''Main function: convert z_score pricing signals into atual positions'''
@@ -13,6 +24,45 @@ class BollingerBandTradeStrategy:
         positions = self._calculate_desired_positions(beta = beta, actions = actions)
         return positions 
     
+    def get_positions_fast(self, z_score: pd.Series, beta: pd.Series) -> pd.DataFrame: 
+        '''Compiled equivalent of get_positions: actions and positions in one pass over raw arrays'''
+        _, positions = self.get_actions_and_positions_fast(z_score, beta)
+        return positions
+
+    def get_actions_and_positions_fast(self, z_score: pd.Series, beta: pd.Series) -> Tuple[pd.DataFrame, pd.DataFrame]: 
+        '''Same output as (_generate_trading_actions, _calculate_desired_positions), without pandas indexing per row'''
+        actions, positions = _bollinger_kernel(
+            z_score.to_numpy(dtype = float), 
+            beta.reindex(z_score.index).to_numpy(dtype = float), 
+            float(self.entry_threshold), 
+            float(self.exit_threshold)
+        )
+        dtypes = PRECISION_DTYPES[self.precision]
+        return (pd.DataFrame(actions.astype(dtypes['action'], copy = False), index = z_score.index, columns = ACTION_COLUMNS), 
+                pd.DataFrame(positions.astype(dtypes['position'], copy = False), index = z_score.index, columns = POSITION_COLUMNS))
+
+    @staticmethod
+    def get_positions_batch(z_score: pd.Series, beta: pd.Series, thresholds: List[Tuple[float, float]], precision: str = 'float64') -> pd.DataFrame: 
+        '''
+        Evaluate many (entry_threshold, exit_threshold) pairs against the same z_score in a single kernel call. 
+
+        Returns: 
+            DataFrame with columns (entry_threshold, exit_threshold, ['position_y', 'position_x'])
+        '''
+        thresholds_arr = np.asarray(thresholds, dtype = float).reshape(-1, 2)
+        positions = _bollinger_batch_kernel(
+            z_score.to_numpy(dtype = float), 
+            beta.reindex(z_score.index).to_numpy(dtype = float), 
+            thresholds_arr
+        )
+        columns = pd.MultiIndex.from_tuples(
+            [(entry, exit, col) for entry, exit in thresholds_arr for col in POSITION_COLUMNS], 
+            names = ['entry_threshold', 'exit_threshold', 'position']
+        )
+        #(n_thresholds, n_periods, 2) -> (n_periods, n_thresholds*2)
+        positions = positions.transpose(1, 0, 2).reshape(len(z_score), -1).astype(PRECISION_DTYPES[precision]['position'], copy = False)
+        return pd.DataFrame(positions, index = z_score.index, columns = columns)
+
     def _generate_trading_actions(self, z_score: pd.Series):
         """
         WHEN you trade 
@@ -163,6 +213,69 @@ class BollingerBandTradeStrategy:
 
         fig.tight_layout()
 
+class OnlineBollingerBandTradeStrategy: 
+    '''Bar by bar version of get_positions_fast for live use: carries the entry/exit state between bars'''
+    def __init__(self, entry_threshold, exit_threshold): 
+        self.entry_threshold = entry_threshold
+        self.exit_threshold = exit_threshold
+        self.position = 0 # 1 for long spread, -1 for short spread, 0 for flat 
+
+    def update(self, z_t: float, beta_t: float) -> Tuple[float, float]: 
+        '''Feed one bar, returns the desired (position_y, position_x)'''
+        _, self.position = _bollinger_step(float(z_t), self.position, float(self.entry_threshold), float(self.exit_threshold))
+        if self.position == 0: 
+            return 0.0, 0.0
+        #Long spread; + 1, -betaX
+        return float(self.position), self.position * (-beta_t)
+
+@njit(cache = True)
+def _bollinger_step(z_t, position, entry_threshold, exit_threshold): 
+    '''One step of the entry/exit state machine: returns (action column or -1, new position)'''
+    if np.isnan(z_t): 
+        return -1, position
+    if position == 0: 
+        if z_t < -entry_threshold: 
+            return 0, 1
+        elif z_t > entry_threshold: 
+            return 1, -1
+    elif position == 1 and z_t > -exit_threshold: 
+        return 2, 0
+    elif position == -1 and z_t < exit_threshold: 
+        return 2, 0
+    return -1, position
+
+@njit(cache = True)
+def _bollinger_kernel(z_score, beta, entry_threshold, exit_threshold): 
+    '''Actions (n, 3) and beta-scaled positions (n, 2) for one threshold pair'''
+    n = len(z_score)
+    #0/1 flags: int8, widened by the caller unless in compact precision 
+    actions = np.zeros((n, 3), dtype = np.int8)
+    positions = np.zeros((n, 2))
+    position = 0
+    for i in range(n): 
+        action, position = _bollinger_step(z_score[i], position, entry_threshold, exit_threshold)
+        if action >= 0: 
+            actions[i, action] = 1
+        if position != 0: 
+            #Long spread; + 1, -betaX
+            positions[i, 0] = position
+            positions[i, 1] = position * (-beta[i])
+    return actions, positions
+
+@njit(cache = True)
+def _bollinger_batch_kernel(z_score, beta, thresholds): 
+    '''Positions (n_thresholds, n, 2) for every (entry, exit) row of thresholds'''
+    n = len(z_score)
+    positions = np.zeros((thresholds.shape[0], n, 2))
+    for k in range(thresholds.shape[0]): 
+        position = 0
+        for i in range(n): 
+            _, position = _bollinger_step(z_score[i], position, thresholds[k, 0], thresholds[k, 1])
+            if position != 0: 
+                positions[k, i, 0] = position
+                positions[k, i, 1] = position * (-beta[i])
+    return positions
+
 def generate_synthetic_zscore(n_periods=100, seed=42):
     '''Generate synthetic z score data that oscillates in a predictable pattern'''
     np.random.seed(seed)
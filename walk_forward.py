@@ -0,0 +1,222 @@
+import os
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from grid_search import backtest_thresholds
+from shared_arrays import SharedArrays, attach_shared_arrays
+from portfolio_manager.constants import PRECISION_DTYPES
+from portfolio_manager.metrics import MetricsCalculator
+from portfolio_manager.portfolio_manager import PortfolioManager
+from pricing_signals import PricingSignal
+from signal_cache import SignalCache
+from trading_strategy import BollingerBandTradeStrategy
+
+FOLD_COLUMNS = ['train_start', 'train_end', 'test_start', 'test_end']
+
+def make_folds(index: pd.DatetimeIndex, train_size, test_size, step = None, expanding: bool = False) -> pd.DataFrame:
+    '''
+    Walk-forward train/test windows over index, all half open [start, end).
+
+    Args:
+        train_size, test_size, step: anything pd.Timedelta accepts, e.g. '7D'. step defaults to test_size, so that
+            test windows tile the data without overlap
+        expanding: if True every training window starts at the start of index, otherwise it rolls forward by step
+    Returns:
+        DataFrame with one row per fold: train_start, train_end, test_start, test_end
+    '''
+    train_size, test_size = pd.Timedelta(train_size), pd.Timedelta(test_size)
+    step = test_size if step is None else pd.Timedelta(step)
+    start, last = index[0], index[-1]
+    folds = []
+    while True:
+        train_end = start + train_size + step * len(folds)
+        if train_end > last:
+            break
+        train_start = start if expanding else train_end - train_size
+        folds.append((train_start, train_end, train_end, train_end + test_size))
+    return pd.DataFrame(folds, columns = FOLD_COLUMNS)
+
+def _signal_arrays(x: pd.Series, y: pd.Series, hedge_lookbacks: List[int], spread_lookbacks: List[int], backend: str,
+                   cache: SignalCache, dtype: str = 'float64') -> Dict[str, np.ndarray]:
+    '''
+    z_score and beta of every (hedge, spread) lookback over the whole series. The rolling windows are causal, so a fold
+    only slices its rows and overlapping folds share one computation (and the cache shares it across runs).
+    '''
+    arrays = {}
+    for hedge_lookback in tqdm(hedge_lookbacks, desc = 'signals'):
+        if cache is None:
+            #Hedge ratio once per hedge_lookback, z_score per spread_lookback as in run_grid_search
+            signal = PricingSignal(hedge_lookback = hedge_lookback, spread_lookback = None, backend = backend)
+            intercept, beta = signal._calculate_hedge_ratio(x, y)
+            spread = signal._calculate_spread(x, y, intercept, beta)
+        for spread_lookback in spread_lookbacks:
+            signal = PricingSignal(hedge_lookback = hedge_lookback, spread_lookback = spread_lookback, backend = backend)
+            if cache is None:
+                z_score = signal._calculate_zscore(spread)
+            else:
+                signal_df = cache.pricing_signal(signal, x, y)
+                z_score, beta = signal_df['z_score'], signal_df['beta']
+            arrays[f'z_score_{hedge_lookback}_{spread_lookback}'] = z_score.to_numpy(dtype = dtype)
+            arrays[f'beta_{hedge_lookback}_{spread_lookback}'] = beta.to_numpy(dtype = dtype)
+    return arrays
+
+#Per-process state, set once by _init_worker
+_WORKER = {}
+
+def _init_worker(specs, meta):
+    arrays, handles = attach_shared_arrays(specs)
+    #Copy: results built on the index outlive the shared block when running inline (max_workers = 1)
+    index = pd.DatetimeIndex(arrays['index'].view(meta['index_dtype']).copy())
+    if meta['tz'] is not None:
+        index = index.tz_localize('UTC').tz_convert(meta['tz'])
+    _WORKER.update(arrays = arrays, handles = handles, meta = meta, index = index)
+
+def _close_worker():
+    #Drop the views before closing the blocks they point into
+    handles = _WORKER.pop('handles', [])
+    _WORKER.clear()
+    for shm in handles:
+        shm.close()
+
+def _run_fold(fold: int, train_rows: Tuple[int, int], test_rows: Tuple[int, int]) -> Dict:
+    '''Worker: grid search on the training rows, then the best parameters on the test rows'''
+    start = time.perf_counter()
+    arrays, meta, index = _WORKER['arrays'], _WORKER['meta'], _WORKER['index']
+    train, test = slice(*train_rows), slice(*test_rows)
+
+    rows = []
+    for hedge_lookback, spread_lookback in meta['lookbacks']:
+        key = f'{hedge_lookback}_{spread_lookback}'
+        z_score = pd.Series(arrays[f'z_score_{key}'][train], index = index[train])
+        beta = pd.Series(arrays[f'beta_{key}'][train], index = index[train])
+        rows.extend(
+            {'fold': fold, 'hedge_lookback': hedge_lookback, 'spread_lookback': spread_lookback, **row}
+            for row in backtest_thresholds(index[train], meta['coins'], z_score, beta, meta['thresholds'], arrays['bid'][train],
+                                           arrays['ask'][train], meta['portfolio_kwargs'], instant_execution = meta['instant_execution'])
+        )
+    search_df = pd.DataFrame(rows)
+    #Row dict rather than the DataFrame row, which would upcast the lookbacks to float
+    best = rows[search_df[meta['objective']].idxmax()] if search_df[meta['objective']].notna().any() else rows[0]
+
+    #Out of sample: the fold starts flat with the initial capital
+    key = f"{best['hedge_lookback']}_{best['spread_lookback']}"
+    strategy = BollingerBandTradeStrategy(entry_threshold = best['entry_threshold'], exit_threshold = best['exit_threshold'],
+                                          precision = meta['portfolio_kwargs'].get('precision', 'float64'))
+    close_position = strategy.get_positions_fast(pd.Series(arrays[f'z_score_{key}'][test], index = index[test]),
+                                                 pd.Series(arrays[f'beta_{key}'][test], index = index[test])).to_numpy()
+    pm = PortfolioManager(**meta['portfolio_kwargs'])
+    backtest = pm.backtest_arrays(index[test], meta['coins'], close_position, arrays['bid'][test], arrays['ask'][test],
+                                  instant_execution = meta['instant_execution'])
+    return {
+        'search_df': search_df,
+        'best': best,
+        'summary_df': backtest['summary_df'],
+        'test_metrics': {metric: value for metric, value in backtest.items() if metric != 'summary_df'},
+        'is_liquidated': pm.is_liquidated,
+        'seconds': time.perf_counter() - start,
+        'pid': os.getpid(),
+    }
+
+def run_walk_forward(prices_df: pd.DataFrame,
+                     y_coin: str,
+                     x_coin: str,
+                     folds: pd.DataFrame,
+                     hedge_lookbacks: List[int],
+                     spread_lookbacks: List[int],
+                     entry_thresholds: List[float],
+                     exit_thresholds: List[float],
+                     portfolio_kwargs: Dict,
+                     objective: str = 'sharpe',
+                     signal_price: str = 'mid_price',
+                     backend: str = 'statsmodels',
+                     cache: SignalCache = None,
+                     instant_execution: bool = False,
+                     max_workers: int = None) -> Dict:
+    '''
+    Walk-forward optimisation: for every fold, grid search PricingSignal lookbacks and BollingerBandTradeStrategy thresholds
+    on the training window, pick the best by objective, trade it on the test window, and stitch the test windows.
+
+    Signals are computed once over the whole series (optionally through a SignalCache) and sliced per fold; folds run in
+    a process pool reading prices and signals from shared memory.
+
+    Args:
+        prices_df: (coin, field) columns, with 'bid', 'ask' and signal_price fields for y_coin and x_coin
+        folds: from make_folds
+        objective: in-sample metric to maximise, one of grid_search.METRIC_COLUMNS
+    Returns:
+        {
+            'folds': folds with the chosen parameters, in-sample objective and out-of-sample metrics,
+            'search': every in-sample backtest row,
+            'equity_curve': out-of-sample equity of the test windows chained one after the other,
+            'summary_df': the test windows' summary_df, concatenated,
+            **metrics of the stitched out-of-sample pnl
+        }
+    '''
+    coins = [y_coin, x_coin]
+    index = prices_df.index
+    thresholds = [(float(entry), float(exit)) for entry, exit in itertools.product(entry_thresholds, exit_thresholds) if exit < entry]
+    lookbacks = list(itertools.product(hedge_lookbacks, spread_lookbacks))
+
+    dtypes = PRECISION_DTYPES[portfolio_kwargs.get('precision', 'float64')]
+    arrays = {
+        'index': index.asi8,
+        'bid': prices_df.xs('bid', axis = 1, level = 1)[coins].to_numpy(dtype = dtypes['price']),
+        'ask': prices_df.xs('ask', axis = 1, level = 1)[coins].to_numpy(dtype = dtypes['price']),
+        **_signal_arrays(prices_df[x_coin][signal_price], prices_df[y_coin][signal_price], hedge_lookbacks, spread_lookbacks, backend, cache,
+                         dtype = dtypes['signal']),
+    }
+    meta = {
+        'coins': coins,
+        'tz': index.tz,
+        'index_dtype': f'datetime64[{index.unit}]',
+        'lookbacks': lookbacks,
+        'thresholds': thresholds,
+        'objective': objective,
+        'portfolio_kwargs': portfolio_kwargs,
+        'instant_execution': instant_execution,
+    }
+    tasks = [
+        (fold, (index.searchsorted(row.train_start), index.searchsorted(row.train_end)), (index.searchsorted(row.test_start), index.searchsorted(row.test_end)))
+        for fold, row in enumerate(folds.itertuples())
+    ]
+    with SharedArrays(arrays) as shared:
+        if max_workers == 1:
+            _init_worker(shared.specs, meta)
+            outputs = [_run_fold(*task) for task in tqdm(tasks, desc = 'folds')]
+            _close_worker()
+        else:
+            with ProcessPoolExecutor(max_workers = max_workers, initializer = _init_worker, initargs = (shared.specs, meta)) as pool:
+                outputs = list(tqdm(pool.map(_run_fold, *zip(*tasks)), total = len(tasks), desc = 'folds'))
+
+    best_df = pd.DataFrame([output['best'] for output in outputs])[['hedge_lookback', 'spread_lookback', 'entry_threshold', 'exit_threshold', objective]]
+    folds_df = pd.concat([
+        folds.reset_index(drop = True),
+        best_df.rename(columns = {objective: f'train_{objective}'}).reset_index(drop = True),
+        pd.DataFrame([output['test_metrics'] for output in outputs]).add_prefix('test_'),
+    ], axis = 1)
+    folds_df['is_liquidated'] = [output['is_liquidated'] for output in outputs]
+    folds_df['seconds'] = [output['seconds'] for output in outputs]
+
+    #Stitch: each test window's pnl continues from the previous window's final equity. Every window starts from
+    #initial_capital, so its first bar's pnl (entry spread and fees with instant_execution) is equity[0] - initial_capital
+    summary_df = pd.concat([output['summary_df'] for output in outputs], keys = range(len(outputs)), names = ['fold', None])
+    initial_capital = PortfolioManager(**portfolio_kwargs).initial_capital
+    pnl = pd.concat([
+        pd.Series(np.diff(equity.to_numpy(), prepend = initial_capital), index = equity.index)
+        for equity in (output['summary_df']['PnL']['equity_curve'] for output in outputs)
+    ])
+    equity_curve = initial_capital + pnl.cumsum()
+    metrics_calc = MetricsCalculator(periods_per_year = portfolio_kwargs['trading_periods_per_year'])
+    return {
+        'folds': folds_df,
+        'search': pd.concat([output['search_df'] for output in outputs], ignore_index = True),
+        'equity_curve': equity_curve,
+        'summary_df': summary_df,
+        **metrics_calc.risk_adjusted.get_all(pnl, initial_capital),
+    }